@@ -0,0 +1,230 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from lru_ttl_cache import LRUTTLCache
+
+logger = logging.getLogger(__name__)
+
+# Knowledge base version, bumped by the exporter whenever new content is pushed to the knowledge base.
+# Every AnswerCache watching it drops its entries when the version changes. Bedrock only answers from
+# the new content once the data source ingestion sync has run, so bump it again when the sync completes
+# (python -c "from answer_cache import notify_kb_updated; notify_kb_updated()").
+DEFAULT_VERSION_FILE = '.kb_version'
+
+
+def normalize_question(text):
+    # Lowercase, drop Slack mentions/links and punctuation, collapse whitespace
+    text = re.sub(r'<[^>]*>', ' ', text.lower())
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return ' '.join(text.split())
+
+
+def shingles(text, size=3):
+    # Character shingles of a normalized question, used for near-duplicate matching
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class FileVersionStore:
+    # Version kept as the mtime of a local file: only shared by processes on one host and directory
+
+    def __init__(self, path=DEFAULT_VERSION_FILE):
+        self.path = path
+
+    def read(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def bump(self):
+        with open(self.path, 'w') as f:
+            f.write(str(time.time()))
+
+    def __str__(self):
+        return self.path
+
+
+class SQLiteVersionStore:
+    # Version kept in a SQLite file, shared by every process that opens it (e.g. SLACK_RATE_LIMIT_DB)
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("CREATE TABLE IF NOT EXISTS kb_version (name TEXT PRIMARY KEY, version TEXT NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+    def read(self):
+        row = self._connect().execute("SELECT version FROM kb_version WHERE name = 'kb'").fetchone()
+        return row[0] if row else None
+
+    def bump(self):
+        self._connect().execute("INSERT OR REPLACE INTO kb_version (name, version) VALUES ('kb', ?)",
+                                (str(time.time_ns()),))
+
+    def __str__(self):
+        return f"sqlite:{self.path}"
+
+
+class S3VersionStore:
+    # Version kept as the ETag of an S3 object: shared by the exporter and the bots on every host
+
+    def __init__(self, uri, s3=None):
+        self.bucket, _, self.key = uri[len('s3://'):].partition('/')
+        self._s3 = s3
+
+    def _client(self):
+        if self._s3 is None:
+            import boto3
+            self._s3 = boto3.client('s3')
+        return self._s3
+
+    def read(self):
+        from botocore.exceptions import ClientError
+        try:
+            return self._client().head_object(Bucket=self.bucket, Key=self.key)['ETag']
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def bump(self):
+        self._client().put_object(Bucket=self.bucket, Key=self.key, Body=str(time.time()).encode('utf-8'))
+
+    def __str__(self):
+        return f"s3://{self.bucket}/{self.key}"
+
+
+def make_version_store(s3=None):
+    # Pick where the knowledge base version lives from KB_VERSION_LOCATION: an s3://bucket/key object,
+    # a sqlite:<path> database or a local file (default KB_CACHE_VERSION_FILE, .kb_version)
+    location = os.getenv('KB_VERSION_LOCATION') or os.getenv('KB_CACHE_VERSION_FILE', DEFAULT_VERSION_FILE)
+    if location.startswith('s3://'):
+        return S3VersionStore(location, s3=s3)
+    if location.startswith('sqlite:'):
+        return SQLiteVersionStore(location[len('sqlite:'):])
+    return FileVersionStore(location)
+
+
+def notify_kb_updated(version_store=None):
+    # Invalidation hook: called after new knowledge base content has been uploaded.
+    # The content is already uploaded, so a failed bump is logged, not raised
+    version_store = version_store or make_version_store()
+    try:
+        version_store.bump()
+    except Exception as e:
+        logger.warning(f"Could not bump the knowledge base version ({version_store}): {e}")
+        return False
+    logger.info(f"Knowledge base version bumped ({version_store})")
+    return True
+
+
+class AnswerCache:
+    """LRU+TTL cache of knowledge base answers keyed by the normalized question.
+
+    When similarity_threshold is set, a miss on the exact key falls back to the
+    cached question with the highest shingle Jaccard similarity above the threshold.
+    The version store is read on the first get() or put(), not when the cache is built
+    (it is built at import), then at most once per version_poll_interval seconds.
+    """
+
+    def __init__(self, max_size=512, ttl=6 * 60 * 60, similarity_threshold=None, version_store=None,
+                 version_poll_interval=0, clock=time.monotonic):
+        self._entries = LRUTTLCache(max_size=max_size, ttl=ttl)
+        self.similarity_threshold = similarity_threshold
+        self.version_store = version_store
+        self.version_poll_interval = version_poll_interval
+        self._clock = clock
+        self._next_version_check = None
+        self._version_loaded = False
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _read_version(self):
+        if self.version_store is None:
+            return None
+        try:
+            return self.version_store.read()
+        except Exception as e:
+            # Keep serving the cached answers while the version cannot be read
+            logger.warning(f"Could not read the knowledge base version ({self.version_store}): {e}")
+            return self._version
+
+    def _check_version(self):
+        now = self._clock()
+        if self._version_loaded and now < self._next_version_check:
+            return
+        self._next_version_check = now + self.version_poll_interval
+        version = self._read_version()
+        if not self._version_loaded:
+            # First read: the entries (if any) were put under this version
+            self._version_loaded = True
+            self._version = version
+        elif version != self._version:
+            self._version = version
+            self.invalidate()
+
+    def get(self, question):
+        self._check_version()
+        key = normalize_question(question)
+        entry = self._entries.get(key)
+
+        if entry is None and self.similarity_threshold:
+            question_shingles = shingles(key)
+            best_score = 0.0
+            for _, candidate in self._entries.items():
+                score = jaccard(question_shingles, candidate[0])
+                if score >= self.similarity_threshold and score > best_score:
+                    best_score, entry = score, candidate
+            if entry is not None:
+                with self._lock:
+                    self.similar_hits += 1
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return entry[1]
+
+    def put(self, question, answer):
+        self._check_version()
+        key = normalize_question(question)
+        self._entries.put(key, (shingles(key), answer))
+
+    def invalidate(self):
+        self._entries.clear()
+        with self._lock:
+            self.invalidations += 1
+        logger.info("Answer cache invalidated")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
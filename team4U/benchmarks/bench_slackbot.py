@@ -0,0 +1,318 @@
+import argparse
+import copy
+import gc
+import hashlib
+import hmac
+import http.client
+import json
+import logging
+import os
+import random
+import re
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from stubs import SlackStubServer, StubBedrockAgentRuntime, parse_latency
+
+# Load test of the Flask bot (slackbot.py): replays the recorded Slack event payloads in payloads/
+# against POST /slack/events, with the Slack Web API and Bedrock replaced by local stubs.
+#
+#   python benchmarks/bench_slackbot.py --requests 1000 --rate 100 --bedrock-latency lognormal:1.5:0.4
+#
+# Reports ack and end-to-end answer latency percentiles, throughput, duplicate deliveries that
+# were answered twice, shed events and memory growth. --max-p99-ack-ms makes it exit non-zero
+# when the ack path regresses, so it can gate a deploy.
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PAYLOAD_DIR = os.path.join(BENCH_DIR, 'payloads')
+SIGNING_SECRET = 'bench-signing-secret'
+TARGET_CHANNEL_ID = 'C0DEVELOPERS'
+EVENT_KINDS = ('mention', 'bot_message', 'guru_help', 'url_verification')
+MARKER = re.compile(r'\[bench:(\d+\.\d+)\]')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay Slack events against slackbot.py with stubbed Slack and Bedrock")
+    parser.add_argument('--requests', type=int, default=500, help="Events to send (default: 500)")
+    parser.add_argument('--rate', type=float, default=50,
+                        help="Events per second, 0 sends as fast as the senders allow (default: 50)")
+    parser.add_argument('--concurrency', type=int, default=32, help="Parallel HTTP senders (default: 32)")
+    parser.add_argument('--mix', default='mention=0.45,bot_message=0.33,guru_help=0.02,url_verification=0.2',
+                        help="Weights of the event kinds")
+    parser.add_argument('--channels', type=int, default=50,
+                        help="Channels the questions are spread over, answers are rate limited per channel "
+                             "(default: 50)")
+    parser.add_argument('--duplicate-rate', type=float, default=0.05,
+                        help="Share of events delivered twice, like Slack retries (default: 0.05)")
+    parser.add_argument('--slack-latency', default='const:0.05', help="Slack Web API stub latency (default: const:0.05)")
+    parser.add_argument('--bedrock-latency', default='lognormal:1.5:0.4',
+                        help="Bedrock stub latency (default: lognormal:1.5:0.4)")
+    parser.add_argument('--streaming', action='store_true', help="Run the bot with STREAMING_ANSWERS=true")
+    parser.add_argument('--workers', type=int, help="WORKER_CONCURRENCY of the bot")
+    parser.add_argument('--queue-depth', type=int, help="WORKER_QUEUE_DEPTH of the bot")
+    parser.add_argument('--no-slack-rate-limits', dest='slack_rate_limits', action='store_false',
+                        help="Lift the documented Slack rate limits, to measure the bot alone")
+    parser.add_argument('--drain', type=float, default=60, help="Seconds to wait for the last answers (default: 60)")
+    parser.add_argument('--seed', type=int, default=1, help="Random seed of the event mix")
+    parser.add_argument('--log-level', default='WARNING', help="Log level of the bot during the run")
+    parser.add_argument('--output', help="Also write the JSON report to this file")
+    parser.add_argument('--max-p99-ack-ms', type=float, help="Exit with status 1 if the p99 ack latency is higher")
+    return parser.parse_args()
+
+
+def configure_environment(args, slack_stub):
+    # Must run before slackbot.create_app() and the modules it loads read their settings
+    os.environ.update({
+        'SLACK_BOT_TOKEN': 'xoxb-bench',
+        'SLACK_SIGNING_SECRET': SIGNING_SECRET,
+        'SLACK_API_BASE_URL': slack_stub.base_url,
+        'TARGET_CHANNEL_ID': TARGET_CHANNEL_ID,
+        'KB_CACHE_ENABLED': 'false',
+        'DEDUP_BACKEND': 'memory',
+        'STREAMING_ANSWERS': 'true' if args.streaming else 'false',
+    })
+    os.environ.pop('SLACK_RATE_LIMIT_DB', None)
+    if args.workers:
+        os.environ['WORKER_CONCURRENCY'] = str(args.workers)
+    if args.queue_depth:
+        os.environ['WORKER_QUEUE_DEPTH'] = str(args.queue_depth)
+    if not args.slack_rate_limits:
+        for tier in (1, 2, 3, 4):
+            os.environ[f'SLACK_TIER{tier}_PER_MINUTE'] = '1000000'
+        os.environ['SLACK_POST_PER_MINUTE'] = '1000000'
+        os.environ['SLACK_POST_WORKSPACE_PER_MINUTE'] = '1000000'
+
+
+def rss_mb():
+    # Current resident set size (peak RSS where /proc is not available)
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def rank(p):
+        return round(ordered[min(len(ordered) - 1, max(0, int(len(ordered) * p / 100 + 0.5) - 1))] * 1000, 2)
+
+    return {'count': len(ordered), 'p50': rank(50), 'p95': rank(95), 'p99': rank(99),
+            'max': round(ordered[-1] * 1000, 2), 'mean': round(sum(ordered) / len(ordered) * 1000, 2)}
+
+
+def load_payloads():
+    payloads = {}
+    for kind in EVENT_KINDS:
+        with open(os.path.join(PAYLOAD_DIR, f'{kind}.json')) as f:
+            payloads[kind] = json.load(f)
+    return payloads
+
+
+def build_events(args, payloads):
+    # Unique copies of the recorded payloads. Returns a list of (kind, body, answer key); the answer
+    # key identifies the Slack post that completes the event (None for url_verification)
+    weights = dict((kind, float(weight)) for kind, weight in
+                   (item.split('=') for item in args.mix.split(',') if item))
+    unknown = set(weights) - set(EVENT_KINDS)
+    if unknown:
+        raise SystemExit(f"Unknown event kinds in --mix: {', '.join(sorted(unknown))}")
+    kinds = random.choices(list(weights), weights=list(weights.values()), k=args.requests)
+
+    events = []
+    roots = []  # Thread roots sent so far and not escalated yet, escalations of these hit the bot's cache
+    for index, kind in enumerate(kinds):
+        payload = copy.deepcopy(payloads[kind])
+        ts = f"{1718000000 + index}.{index % 1000000:06d}"
+        if kind == 'url_verification':
+            events.append((kind, json.dumps(payload), None))
+            continue
+
+        payload['event_id'] = f"EvBENCH{index:08d}"
+        payload['event_time'] = int(float(ts))
+        event = payload['event']
+        event['ts'] = event['event_ts'] = ts
+        event['channel'] = f"C0SUPPORT{index % args.channels:03d}"
+        if kind == 'guru_help':
+            # Half the escalations are for a thread the bot has seen, the others need conversations.replies
+            if roots and random.random() < 0.5:
+                event['channel'], root_ts = roots.pop(random.randrange(len(roots)))
+            else:
+                root_ts = f"{1700000000 + index}.{index % 1000000:06d}"
+            event['thread_ts'] = root_ts
+            answer_key = ('escalation', root_ts)
+        else:
+            event['text'] = f"{event['text']} [bench:{ts}]"
+            roots.append((event['channel'], ts))
+            answer_key = ('answer', ts)
+        events.append((kind, json.dumps(payload), answer_key))
+    return events
+
+
+class Sender:
+    # Posts signed events to the bot, one keep-alive connection per sender thread
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._local = threading.local()
+
+    def post(self, body, retry_num=None):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        timestamp = str(int(time.time()))
+        signature = hmac.new(SIGNING_SECRET.encode(), f"v0:{timestamp}:{body}".encode(), hashlib.sha256).hexdigest()
+        headers = {
+            'Content-Type': 'application/json',
+            'X-Slack-Request-Timestamp': timestamp,
+            'X-Slack-Signature': f"v0={signature}",
+        }
+        if retry_num:
+            headers['X-Slack-Retry-Num'] = str(retry_num)
+            headers['X-Slack-Retry-Reason'] = 'http_timeout'
+        try:
+            connection.request('POST', '/slack/events', body=body.encode('utf-8'), headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self._local.connection = None
+            return None
+
+
+def answer_times(slack_stub, streaming):
+    # Arrival times of the posts that complete each answer key
+    reply_threads = {}  # ts of a streamed reply -> thread_ts of the question
+    completions = {}
+    for arrival, method, channel, thread_ts, ts, text in sorted(slack_stub.posts):
+        key = None
+        if channel == TARGET_CHANNEL_ID:
+            match = MARKER.search(text) or re.search(r'thread (\d+\.\d+)', text)
+            key = ('escalation', match.group(1)) if match else None
+        elif method == 'chat.postMessage' and thread_ts:
+            if streaming:
+                reply_threads[ts] = thread_ts
+            else:
+                key = ('answer', thread_ts)
+        elif method == 'chat.update' and ts in reply_threads and not text.endswith(' ...'):
+            key = ('answer', reply_threads[ts])
+        if key:
+            completions.setdefault(key, []).append(arrival)
+    return completions
+
+
+def main():
+    args = parse_args()
+    random.seed(args.seed)
+
+    slack_stub = SlackStubServer(parse_latency(args.slack_latency)).start()
+    bedrock_stub = StubBedrockAgentRuntime(parse_latency(args.bedrock_latency))
+    configure_environment(args, slack_stub)
+
+    sys.path.insert(0, os.path.dirname(BENCH_DIR))
+    import model_according_to_KB
+    model_according_to_KB.get_bedrock_agent_runtime = lambda: bedrock_stub
+    import slackbot
+    from werkzeug.serving import make_server
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    server = make_server('127.0.0.1', 0, slackbot.create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, name='slackbot', daemon=True).start()
+    sender = Sender('127.0.0.1', server.server_port)
+
+    events = build_events(args, load_payloads())
+    gc.collect()
+    rss_start = rss_mb()
+
+    ack_latencies = {kind: [] for kind in EVENT_KINDS}
+    sent_at = {}
+    errors = []
+    duplicates = 0
+    lock = threading.Lock()
+
+    def send(kind, body, answer_key, scheduled, retry_num=None):
+        status = sender.post(body, retry_num)
+        # Measured from the scheduled time, so queueing in the senders is not hidden
+        latency = time.perf_counter() - scheduled
+        with lock:
+            if status != 200:
+                errors.append(status)
+            elif retry_num is None:
+                ack_latencies[kind].append(latency)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for index, (kind, body, answer_key) in enumerate(events):
+            scheduled = started + index / args.rate if args.rate else time.perf_counter()
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if answer_key:
+                sent_at[answer_key] = scheduled
+            executor.submit(send, kind, body, answer_key, scheduled)
+            if random.random() < args.duplicate_rate:
+                duplicates += 1
+                executor.submit(send, kind, body, answer_key, time.perf_counter(), 1)
+    send_duration = time.perf_counter() - started
+
+    # Wait for the answers still being generated
+    deadline = time.perf_counter() + args.drain
+    while time.perf_counter() < deadline:
+        if set(sent_at) <= set(answer_times(slack_stub, args.streaming)):
+            break
+        time.sleep(0.2)
+
+    completions = answer_times(slack_stub, args.streaming)
+    end_to_end = [min(completions[key]) - scheduled for key, scheduled in sent_at.items() if key in completions]
+    duplicate_answers = sum(1 for key in sent_at if len(completions.get(key, [])) > 1)
+    gc.collect()
+    rss_end = rss_mb()
+
+    all_acks = [latency for latencies in ack_latencies.values() for latency in latencies]
+    report = {
+        'requests': len(events),
+        'duplicates_sent': duplicates,
+        'errors': len(errors),
+        'send_duration_seconds': round(send_duration, 3),
+        'throughput_rps': round(len(all_acks) / send_duration, 2) if send_duration else None,
+        'ack_latency_ms': percentiles(all_acks),
+        'ack_latency_ms_by_kind': {kind: percentiles(latencies) for kind, latencies in ack_latencies.items()},
+        'end_to_end_latency_ms': percentiles(end_to_end),
+        'answers_expected': len(sent_at),
+        'answers_received': len(end_to_end),
+        'duplicate_answers': duplicate_answers,
+        'duplicate_leak_rate': round(duplicate_answers / duplicates, 4) if duplicates else 0.0,
+        'shed_events': slackbot.worker_pool.stats()['rejected'],
+        'memory_mb': {'rss_start': round(rss_start, 1), 'rss_end': round(rss_end, 1),
+                      'growth': round(rss_end - rss_start, 1)},
+        'slack_stub_calls': dict(slack_stub.calls),
+        'bedrock_stub_calls': bedrock_stub.calls,
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output',)},
+    }
+
+    server.shutdown()
+    slack_stub.stop()
+
+    summary = json.dumps(report, indent=2)
+    print(summary)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(summary)
+
+    if args.max_p99_ack_ms is not None and report['ack_latency_ms'] \
+            and report['ack_latency_ms']['p99'] > args.max_p99_ack_ms:
+        print(f"p99 ack latency {report['ack_latency_ms']['p99']} ms is above {args.max_p99_ack_ms} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qsl, urlparse
+
+
+def parse_latency(spec):
+    # Latency distribution in seconds from a spec string, returns a sampler:
+    #   const:0.05   uniform:0.1:0.5   lognormal:<median>:<sigma>   (e.g. lognormal:1.2:0.4)
+    kind, _, args = spec.partition(':')
+    values = [float(value) for value in args.split(':') if value]
+    if kind == 'const' and len(values) == 1:
+        return lambda: values[0]
+    if kind == 'uniform' and len(values) == 2:
+        return lambda: random.uniform(*values)
+    if kind == 'lognormal' and len(values) == 2:
+        median, sigma = values
+        return lambda: median * random.lognormvariate(0, sigma)
+    raise ValueError(f"Invalid latency spec '{spec}', expected const:S, uniform:A:B or lognormal:MEDIAN:SIGMA")
+
+
+class SlackStubServer:
+    """Local stand-in for the Slack Web API (https://slack.com/api/<method>).
+
+    Answers the methods the bot calls after a configurable latency and records
+    every chat.postMessage / chat.update with its arrival time, so the benchmark
+    can measure end-to-end answer latency. Point the bot at it with SLACK_API_BASE_URL.
+    """
+
+    def __init__(self, latency, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.posts = []  # (arrival time, method, channel, thread_ts, ts, text)
+        self.calls = {}
+        self._lock = threading.Lock()
+        self._ts = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='slack-stub', daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _next_ts(self):
+        with self._lock:
+            self._ts += 1
+            return f"{int(time.time())}.{self._ts:06d}"
+
+    def handle(self, method, params):
+        # JSON body of the stubbed Slack method
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        time.sleep(self.latency())
+        if method == 'auth.test':
+            return {'ok': True, 'url': 'https://bench.slack.com/', 'team': 'bench', 'user': 'guru',
+                    'team_id': 'T0BENCH', 'user_id': 'U0GURUBOT', 'bot_id': 'B0GURUBOT'}
+        if method in ('chat.postMessage', 'chat.update'):
+            ts = params.get('ts') or self._next_ts()
+            with self._lock:
+                self.posts.append((time.perf_counter(), method, params.get('channel'), params.get('thread_ts'), ts,
+                                   params.get('text', '')))
+            return {'ok': True, 'channel': params.get('channel'), 'ts': ts,
+                    'message': {'text': params.get('text', ''), 'ts': ts}}
+        if method == 'conversations.replies':
+            thread_ts = params.get('ts')
+            return {'ok': True, 'has_more': False, 'messages': [
+                {'type': 'message', 'user': 'U0ASKER', 'ts': thread_ts, 'thread_ts': thread_ts,
+                 'text': f"Original question of thread {thread_ts}"}]}
+        return {'ok': True}
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self):
+                url = urlparse(self.path)
+                params = dict(parse_qsl(url.query))
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                if body:
+                    if 'json' in (self.headers.get('Content-Type') or ''):
+                        params.update(json.loads(body))
+                    else:
+                        params.update(parse_qsl(body.decode('utf-8')))
+                payload = json.dumps(stub.handle(url.path.rsplit('/', 1)[-1], params)).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = _respond
+            do_POST = _respond
+
+            def log_message(self, format, *args):
+                pass  # Keep the benchmark output readable
+
+        return Handler
+
+
+class StubBedrockAgentRuntime:
+    # Stand-in for the bedrock-agent-runtime client: answers after a sampled latency
+
+    def __init__(self, latency, chunks=8):
+        self.latency = latency
+        self.chunks = chunks
+        self.calls = 0
+        self.meta = SimpleNamespace(endpoint_url='stub://bedrock-agent-runtime')  # Logged by warm_up()
+        self._lock = threading.Lock()
+
+    def _answer(self, request):
+        with self._lock:
+            self.calls += 1
+        return f"Stub answer to: {request['input']['text']}"
+
+    def retrieve_and_generate(self, **request):
+        time.sleep(self.latency())
+        return {'output': {'text': self._answer(request)}}
+
+    def retrieve_and_generate_stream(self, **request):
+        answer = self._answer(request)
+        delay = self.latency() / self.chunks
+        size = max(1, len(answer) // self.chunks)
+
+        def stream():
+            for start in range(0, len(answer), size):
+                time.sleep(delay)
+                yield {'output': {'text': answer[start:start + size]}}
+
+        return {'stream': stream()}
@@ -0,0 +1,167 @@
+import logging
+import os
+import time
+from datetime import datetime
+
+from lru_ttl_cache import LRUTTLCache
+from bot_messages import INTRO_MESSAGE, SUMMARY_MESSAGE, ERROR_MESSAGE
+
+# State and Slack-independent logic of the bot, shared by the Flask (slackbot.py) and ASGI
+# (slackbot_async.py) entry points. They only wrap it with their sync or async Slack and Bedrock I/O.
+# model_according_to_KB is imported when first used: it reads its settings at import, after the
+# entry point's create_app() has loaded .env
+
+logger = logging.getLogger(__name__)
+
+THINKING_MESSAGE = INTRO_MESSAGE + "_Thinking..._"
+# Kept in bedrock_sessions for a thread answered without a Bedrock session (answer cache or fast path)
+ANSWERED_WITHOUT_SESSION = ''
+
+ESCALATION_FAILED_MESSAGE = "Unable to retrieve the original message. Please try again."
+
+
+def thread_key(event):
+    # (channel, ts of the thread root) of a message; a message outside a thread is its own root
+    return event['channel'], event.get('thread_ts', event['ts'])
+
+
+def mention_question(event):
+    # Text of an app mention without the leading <@bot> mention
+    return event['text'].split('>', 1)[-1].strip()
+
+
+def is_escalation(event):
+    return event.get('text', '').strip().upper() == "GURU HELP"
+
+
+def retry_after(error):
+    # Seconds to wait after a SlackApiError, None if it is not a rate limit (429)
+    if error.response.status_code != 429:
+        return None
+    return int(error.response.headers.get("Retry-After", 1))
+
+
+def escalation_text(event, original_message):
+    # Message posted to the developers channel for a GURU HELP event
+    if not original_message:
+        return ESCALATION_FAILED_MESSAGE
+    date_str = datetime.fromtimestamp(float(event['ts'])).strftime("%Y-%m-%d %H:%M:%S")
+    return f"Original message (sent on {date_str}): {original_message}"
+
+
+class BotState:
+    """Per-process state of the bot, keyed by Slack thread.
+
+    thread_roots keeps the text of the thread roots seen in events, so an escalation
+    can usually forward the original question without calling conversations.replies.
+    bedrock_sessions keeps the Bedrock session of each answered thread, so follow-up
+    questions reuse the conversation Bedrock keeps server side; every answer restarts its TTL.
+    A thread answered without a session is recorded too, so its follow-ups skip the
+    context-free answer cache and fast path and get a session from retrieve_and_generate.
+    """
+
+    def __init__(self, thread_roots, bedrock_sessions, streaming_answers=False, update_interval=1.5,
+                 target_channel=None):
+        self.thread_roots = thread_roots
+        self.bedrock_sessions = bedrock_sessions
+        self.streaming_answers = streaming_answers
+        self.update_interval = update_interval
+        self.target_channel = target_channel
+
+    @classmethod
+    def from_env(cls):
+        # Streaming mode: post a placeholder reply and edit it with chat.update as the answer is generated.
+        # chat.update is a Tier 3 method, so edits of one message are spaced by at least SLACK_UPDATE_INTERVAL
+        return cls(
+            thread_roots=LRUTTLCache(max_size=int(os.environ.get("THREAD_ROOT_CACHE_SIZE", "10000")),
+                                     ttl=float(os.environ.get("THREAD_ROOT_CACHE_TTL", str(7 * 24 * 3600)))),
+            bedrock_sessions=LRUTTLCache(max_size=int(os.environ.get("BEDROCK_SESSION_CACHE_SIZE", "2000")),
+                                         ttl=float(os.environ.get("BEDROCK_SESSION_TTL", "3600"))),
+            streaming_answers=os.environ.get("STREAMING_ANSWERS", "false").lower() == "true",
+            update_interval=float(os.environ.get("SLACK_UPDATE_INTERVAL", "1.5")),
+            target_channel=os.environ.get("TARGET_CHANNEL_ID"),  # ID of the developers channel
+        )
+
+    def remember_thread_root(self, event):
+        # Cache the text of a message that starts a thread (or may start one later)
+        text = event.get('text')
+        if text and event.get('ts') and event.get('thread_ts', event['ts']) == event['ts']:
+            self.thread_roots.put((event['channel'], event['ts']), text)
+
+    def cached_thread_root(self, channel, thread_ts):
+        return self.thread_roots.get((channel, thread_ts))
+
+    def remember_replies_root(self, channel, thread_ts, messages):
+        # Cache and return the root from a conversations.replies page, which always starts with it
+        if not messages:
+            return None
+        self.thread_roots.put((channel, thread_ts), messages[0]['text'])
+        return messages[0]['text']
+
+    def thread_session(self, channel, thread_ts):
+        # (Bedrock session id or None, whether the bot already answered in the thread)
+        session = self.bedrock_sessions.get((channel, thread_ts))
+        return session or None, session is not None
+
+    def remember_session(self, channel, thread_ts, session_id):
+        # Record that the thread has been answered, with its Bedrock session when there is one
+        self.bedrock_sessions.put((channel, thread_ts), session_id or ANSWERED_WITHOUT_SESSION)
+
+    def answer(self, message, channel, thread_ts):
+        # Blocking: the reply to a question, continuing the thread's Bedrock session if it has one
+        from model_according_to_KB import query_knowledge_base_session
+        try:
+            session_id, follow_up = self.thread_session(channel, thread_ts)
+            answer, new_session_id = query_knowledge_base_session(message, session_id, follow_up=follow_up)
+            self.remember_session(channel, thread_ts, new_session_id or session_id)
+            return INTRO_MESSAGE + answer + SUMMARY_MESSAGE
+        except Exception as e:
+            logger.error(f"Error in processing message: {str(e)}")
+            return ERROR_MESSAGE
+
+    def answer_stream(self, message, channel, thread_ts):
+        # Blocking iterator over the answer chunks, continuing the thread's Bedrock session if it has one.
+        # The thread is recorded as answered right away, on_session adds the session once Bedrock has it
+        from model_according_to_KB import query_knowledge_base_stream
+        session_id, follow_up = self.thread_session(channel, thread_ts)
+        self.remember_session(channel, thread_ts, session_id)
+        return query_knowledge_base_stream(
+            message, session_id, lambda new_session_id: self.remember_session(channel, thread_ts, new_session_id),
+            follow_up=follow_up)
+
+    def streamed_reply(self, update_limiter):
+        return StreamedReply(update_limiter, self.update_interval)
+
+
+class StreamedReply:
+    """An answer streamed into one Slack message, batched into chat.update edits.
+
+    add() returns the text of the next intermediate edit, or None while the chunks
+    are batched until the next update slot or while the shared chat.update budget
+    is exhausted. The caller sends the edit and reports how it went.
+    """
+
+    def __init__(self, update_limiter, interval, clock=time.monotonic):
+        self.update_limiter = update_limiter
+        self.interval = interval
+        self.answer = ""
+        self._clock = clock
+        self._next_update = clock() + interval
+
+    def add(self, chunk):
+        self.answer += chunk
+        now = self._clock()
+        if now < self._next_update or not self.update_limiter.try_acquire():
+            return None
+        self._next_update = now + self.interval
+        return INTRO_MESSAGE + self.answer + " ..."
+
+    def edit_sent(self):
+        self.update_limiter.on_success()
+
+    def edit_rate_limited(self, retry_after):
+        logger.warning(f"chat.update rate limited, pausing edits for {retry_after} seconds.")
+        self.update_limiter.on_rate_limited(retry_after)
+
+    def final_text(self):
+        return INTRO_MESSAGE + self.answer + SUMMARY_MESSAGE
@@ -0,0 +1,6 @@
+# Texts of the bot replies, shared by the Flask (slackbot.py) and ASGI (slackbot_async.py) entry points
+
+INTRO_MESSAGE = "Hello I am Guru bot, and the answer I am providing is based on previous responses.\n\n\n"
+SUMMARY_MESSAGE = ("\n\n\nIf the answer is not sufficient and you would like to escalate this to a developer, please"
+                   " reply to your original question with 'GURU HELP'.")
+ERROR_MESSAGE = "An error occurred while processing your request. Please try again or contact support."
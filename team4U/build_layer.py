@@ -0,0 +1,215 @@
+import argparse
+import base64
+import csv
+import fnmatch
+import hashlib
+import importlib.util
+import os
+import py_compile
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+# Reproducible build of the Lambda layer (python.zip) from the vendored python/ tree:
+#   python build_layer.py [--mypyc] [--output python.zip]
+# Run it with the interpreter of the target Lambda runtime (e.g. inside public.ecr.aws/lambda/python:3.12),
+# the .pyc files and mypyc extensions it produces only load on that Python version and platform.
+
+# Never needed on Lambda: bytecode of the developer's interpreter, Windows binaries and console scripts
+EXCLUDE_PATTERNS = ['__pycache__', '*.pyc', '*.pyd', '*.exe', '*.dll']
+EXCLUDE_DIRS = ['bin', 'urllib3/contrib/emscripten']  # Relative to the layer's python/ directory
+# Optional integrations, dropped when the package they wrap is not in the layer
+OPTIONAL_MODULES = {
+    'urllib3/contrib/socks.py': 'socks',
+    'urllib3/contrib/pyopenssl.py': 'OpenSSL',
+}
+# charset_normalizer's hot modules, compiled to C extensions with --mypyc
+MYPYC_MODULES = ['charset_normalizer/md.py', 'charset_normalizer/cd.py']
+# Fixed timestamp of every zip entry, so the same tree always gives the same bytes
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def verify_records(source):
+    # Check every vendored file against the sha256 in its package's dist-info RECORD, so a locally
+    # modified file (e.g. an extra CA appended to certifi/cacert.pem) never ships in the layer
+    mismatches = []
+    for name in sorted(os.listdir(source)):
+        record = os.path.join(source, name, 'RECORD')
+        if not name.endswith('.dist-info') or not os.path.isfile(record):
+            continue
+        with open(record, newline='') as f:
+            for row in csv.reader(f):
+                if len(row) < 2 or not row[1].startswith('sha256='):
+                    continue
+                path = os.path.join(source, row[0])
+                if not os.path.isfile(path):
+                    continue  # Files stripped from the vendored tree (e.g. bin/) are not checked
+                with open(path, 'rb') as data:
+                    digest = base64.urlsafe_b64encode(hashlib.sha256(data.read()).digest()).rstrip(b'=').decode()
+                if digest != row[1][len('sha256='):]:
+                    mismatches.append(row[0])
+    return mismatches
+
+
+def is_excluded(relative_path):
+    parts = relative_path.split('/')
+    if any(fnmatch.fnmatch(part, pattern) for part in parts for pattern in EXCLUDE_PATTERNS):
+        return True
+    return any(relative_path == directory or relative_path.startswith(directory + '/') for directory in EXCLUDE_DIRS)
+
+
+def stage_tree(source, staging):
+    # Copy the layer into staging without the excluded files, returns the removed paths
+    removed = []
+    for root, dirs, files in os.walk(source):
+        relative_root = os.path.relpath(root, source).replace(os.sep, '/')
+        prefix = '' if relative_root == '.' else relative_root + '/'
+        removed.extend(prefix + name for name in sorted(dirs + files) if is_excluded(prefix + name))
+        dirs[:] = [name for name in dirs if not is_excluded(prefix + name)]
+        for name in files:
+            relative_path = prefix + name
+            if is_excluded(relative_path):
+                continue
+            target = os.path.join(staging, relative_path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(os.path.join(root, name), target)
+
+    for relative_path, dependency in OPTIONAL_MODULES.items():
+        present = os.path.isdir(os.path.join(staging, dependency)) or \
+            os.path.isfile(os.path.join(staging, dependency + '.py'))
+        target = os.path.join(staging, relative_path)
+        if not present and os.path.exists(target):
+            os.remove(target)
+            removed.append(relative_path)
+    return removed
+
+
+def compile_with_mypyc(staging):
+    # Build C extensions of MYPYC_MODULES next to their sources (needs: pip install mypy)
+    if not sys.platform.startswith('linux'):
+        raise SystemExit("--mypyc must run on Linux (ideally the Lambda build image) to produce manylinux extensions")
+    subprocess.run([sys.executable, '-m', 'mypyc', *MYPYC_MODULES], cwd=staging, check=True)
+    for build_artifact in ('build', '.mypy_cache'):
+        shutil.rmtree(os.path.join(staging, build_artifact), ignore_errors=True)
+    # The C extension wins over md.py/cd.py at import; the sources stay as a fallback for tracebacks
+
+
+def compile_bytecode(staging):
+    # Lambda mounts layers read-only, so without these every cold start recompiles the sources.
+    # Unchecked hash based .pyc do not depend on file mtimes, which keeps the zip reproducible
+    count = 0
+    for root, dirs, files in os.walk(staging):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith('.py'):
+                path = os.path.join(root, name)
+                # Record the path the layer is mounted at, not the temporary staging directory
+                display_path = '/opt/python/' + os.path.relpath(path, staging).replace(os.sep, '/')
+                py_compile.compile(path, cfile=importlib.util.cache_from_source(path), dfile=display_path,
+                                   doraise=True, invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+                count += 1
+    return count
+
+
+def write_zip(staging, output):
+    # Deterministic zip: sorted entries, fixed timestamps and permissions, everything under python/
+    paths = []
+    for root, dirs, files in os.walk(staging):
+        for name in files:
+            paths.append(os.path.relpath(os.path.join(root, name), staging).replace(os.sep, '/'))
+
+    tmp_output = output + '.tmp'
+    with zipfile.ZipFile(tmp_output, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as archive:
+        for relative_path in sorted(paths):
+            info = zipfile.ZipInfo(f"python/{relative_path}", date_time=ZIP_DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            mode = 0o755 if relative_path.endswith('.so') else 0o644
+            info.external_attr = (0o100000 | mode) << 16
+            with open(os.path.join(staging, relative_path), 'rb') as f:
+                archive.writestr(info, f.read(), compresslevel=9)
+    os.replace(tmp_output, output)
+    return len(paths)
+
+
+def measure_import(path, modules, runs):
+    # Median wall time of a fresh interpreter importing modules from path, as on a read-only layer
+    env = dict(os.environ, PYTHONPATH=path, PYTHONDONTWRITEBYTECODE='1')
+    code = f"import {', '.join(modules)}"
+    baseline_runs, import_runs = [], []
+    for _ in range(runs):
+        for command, results in ((['-c', 'pass'], baseline_runs), (['-c', code], import_runs)):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, '-s', *command], env=env, check=True)
+            results.append(time.perf_counter() - started)
+    return (statistics.median(import_runs) - statistics.median(baseline_runs)) * 1000
+
+
+def tree_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build a cold-start optimized Lambda layer zip from python/")
+    parser.add_argument('--source', default='python', help="Vendored layer directory (default: python)")
+    parser.add_argument('--output', default='python.zip', help="Layer zip to write (default: python.zip)")
+    parser.add_argument('--runtime', default=f"{sys.version_info.major}.{sys.version_info.minor}",
+                        help="Python version of the Lambda runtime, must match this interpreter (default: current)")
+    parser.add_argument('--mypyc', action='store_true', help="Compile charset_normalizer md.py/cd.py with mypyc")
+    parser.add_argument('--allow-modified', action='store_true',
+                        help="Build even if vendored files differ from their dist-info RECORD hashes")
+    parser.add_argument('--no-bytecode', action='store_true', help="Do not pre-compile .pyc files")
+    parser.add_argument('--check-imports', default='requests',
+                        help="Comma separated modules imported to validate the layer and time it (default: requests)")
+    parser.add_argument('--import-runs', type=int, default=5, help="Runs of the import time measurement (default: 5)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    current = f"{sys.version_info.major}.{sys.version_info.minor}"
+    if args.runtime != current and (not args.no_bytecode or args.mypyc):
+        raise SystemExit(f"Building for Python {args.runtime} needs that interpreter, this is Python {current}. "
+                         f"Run it in the Lambda build image or pass --no-bytecode.")
+
+    mismatches = verify_records(args.source)
+    if mismatches:
+        message = f"{len(mismatches)} vendored files differ from their RECORD hashes: {', '.join(mismatches)}"
+        if not args.allow_modified:
+            raise SystemExit(message + ". Restore them (git checkout -- python/) or pass --allow-modified.")
+        print("Warning: " + message)
+
+    modules = [module.strip() for module in args.check_imports.split(',') if module.strip()]
+    size_before = os.path.getsize(args.output) if os.path.exists(args.output) else None
+    source_size = tree_size(args.source)
+
+    with tempfile.TemporaryDirectory(prefix='layer-') as staging:
+        removed = stage_tree(args.source, staging)
+        print(f"Stripped {len(removed)} paths: {', '.join(path for path in removed if '__pycache__' not in path)}")
+        if args.mypyc:
+            compile_with_mypyc(staging)
+            print(f"Compiled {', '.join(MYPYC_MODULES)} with mypyc")
+        if not args.no_bytecode:
+            print(f"Pre-compiled {compile_bytecode(staging)} modules for Python {args.runtime}")
+
+        import_before = import_after = None
+        if modules:
+            import_before = measure_import(os.path.abspath(args.source), modules, args.import_runs)
+            import_after = measure_import(staging, modules, args.import_runs)
+
+        files = write_zip(staging, args.output)
+
+    size_after = os.path.getsize(args.output)
+    print(f"Wrote {args.output}: {files} files, {size_after / 1024:.0f} KiB"
+          + (f" (was {size_before / 1024:.0f} KiB)" if size_before is not None else "")
+          + f", {source_size / 1024:.0f} KiB source tree")
+    if modules:
+        print(f"Import time of {', '.join(modules)}: {import_before:.1f} ms from {args.source}/, "
+              f"{import_after:.1f} ms from the built layer ({import_after - import_before:+.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,37 @@
 import time
-import requests
-import csv
+import io
+import json
 from datetime import datetime
 import os
-import boto3
-from dotenv import load_dotenv
-from botocore.exceptions import NoCredentialsError
-import io
-
-# Load environment variables from .env file
-load_dotenv()
+import sys
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+
+# Load environment variables from .env file when run as a script (importers provide the environment).
+# Before the imports below: slack_rate_limit and slack_http read their settings at import
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+# boto3 and botocore are imported where they are used, so importing this module stays cheap
+from answer_cache import make_version_store, notify_kb_updated
+from slack_rate_limit import get_limiter
+from slack_http import get_slack_session, SLACK_HTTP_TIMEOUT
+from s3_stream import S3MultipartWriter
+from export_formats import open_row_writer, EXPORT_FORMATS
+from kb_documents import KBDocumentBuilder
+from export_metrics import Metrics
 
 # Settings from the ENV file
 SLACK_TOKEN = os.getenv('SLACK_BOT_TOKEN')
 SLACK_APP_TOKEN = os.getenv('SLACK_APP_TOKEN')
 CHANNEL_ID = os.getenv('SLACK_CHANNEL_ID')
+# Comma separated channels to export, falls back to SLACK_CHANNEL_ID. When both are unset, every
+# channel the bot is a member of is discovered (optionally only names starting with SLACK_CHANNEL_PREFIX)
+CHANNEL_IDS = [channel_id.strip() for channel_id in os.getenv('SLACK_CHANNEL_IDS', CHANNEL_ID or '').split(',')
+               if channel_id.strip()]
+CHANNEL_NAME_PREFIX = os.getenv('SLACK_CHANNEL_PREFIX', '')
+CHANNEL_TYPES = os.getenv('SLACK_CHANNEL_TYPES', 'public_channel,private_channel')
 SLACK_SIGNING_SECRET = os.getenv('SLACK_SIGNING_SECRET')
 
 AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
@@ -22,6 +39,36 @@ AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
 
 API_URL = 'https://slack.com/api/conversations.history'
 
+# Where the per-channel high-water marks are kept: an S3 bucket if set, otherwise a local directory
+CHECKPOINT_BUCKET = os.getenv('CHECKPOINT_BUCKET')
+CHECKPOINT_DIR = os.getenv('CHECKPOINT_DIR', 'checkpoints')
+# How far back the first run (no checkpoint yet) looks
+INITIAL_LOOKBACK_HOURS = float(os.getenv('INITIAL_LOOKBACK_HOURS', '24'))
+# Parent messages this recent are re-listed every run to spot new replies through their latest_reply
+THREAD_LOOKBACK_DAYS = float(os.getenv('THREAD_LOOKBACK_DAYS', '7'))
+# Number of channels exported in parallel
+CHANNEL_WORKERS = int(os.getenv('CHANNEL_WORKERS', '4'))
+# Number of threads whose replies are fetched in parallel (per channel)
+REPLY_FETCH_WORKERS = int(os.getenv('REPLY_FETCH_WORKERS', '8'))
+# Multipart upload of the export: part size in MiB and parts uploaded in parallel
+UPLOAD_PART_SIZE = int(os.getenv('UPLOAD_PART_SIZE_MB', '8')) * 1024 * 1024
+UPLOAD_CONCURRENCY = int(os.getenv('UPLOAD_CONCURRENCY', '4'))
+BUCKET_NAME = os.getenv('EXPORT_BUCKET', 'kb-team4u')
+# Output format of the export: csv, jsonl, jsonl.gz, jsonl.zst or parquet
+EXPORT_FORMAT = os.getenv('EXPORT_FORMAT', 'csv')
+# Also maintain one de-duplicated KB document per thread, uploaded only when its content changes
+KB_DOCUMENTS = os.getenv('KB_DOCUMENTS', 'false').lower() == 'true'
+KB_DOCS_PREFIX = os.getenv('KB_DOCS_PREFIX', 'kb-docs/')
+KB_STATE_PREFIX = os.getenv('KB_STATE_PREFIX', 'kb-state/')
+# Print raw Slack API response bodies (slow, for debugging only)
+DEBUG_RESPONSES = os.getenv('DEBUG_RESPONSES', 'false').lower() == 'true'
+# Optional run summary outputs, the JSON summary is always printed
+METRICS_JSON_FILE = os.getenv('METRICS_JSON_FILE')
+METRICS_PROM_FILE = os.getenv('METRICS_PROM_FILE')  # e.g. for the node exporter textfile collector
+
+# Counters and stage timings of this run, reported by main() when the process exits
+metrics = Metrics('slack_export')
+
 # Define headers globally
 headers = {
     'Authorization': f'Bearer {SLACK_TOKEN}'
@@ -29,7 +76,11 @@ headers = {
 
 # Function to check if the token is valid
 def check_token_validity():
-    response = requests.get('https://slack.com/api/auth.test', headers=headers)
+    get_limiter('auth.test').acquire()
+    with metrics.timer('auth.test'):
+        response = get_slack_session().get('https://slack.com/api/auth.test', headers=headers,
+                                           timeout=SLACK_HTTP_TIMEOUT)
+    metrics.incr('requests')
     if response.status_code == 200:
         data = response.json()
         if data.get('ok'):
@@ -43,17 +94,28 @@ def check_token_validity():
 
 # Function to make requests with retries in case of temporary errors
 def make_request_with_retry(url, params, headers, retries=3):
+    # Every worker shares the adaptive token bucket of the method's Slack tier
+    limiter = get_limiter(url.rsplit('/', 1)[-1])
     for attempt in range(retries):
-        response = requests.get(url, params=params, headers=headers)
+        limiter.acquire()
+        # One pooled keep-alive session for every Slack call, connection errors and 5xx are retried by its adapter
+        response = get_slack_session().get(url, params=params, headers=headers, timeout=SLACK_HTTP_TIMEOUT)
+        metrics.incr('requests')
+        metrics.incr('bytes_downloaded', len(response.content))
         if response.status_code == 200:
+            limiter.on_success()
             return response
         elif response.status_code == 429:
             retry_after = int(response.headers.get("Retry-After", 1))
-            print(f"Rate limit hit. Sleeping for {retry_after} seconds.")
-            time.sleep(retry_after)
+            print(f"Rate limit hit. Pausing all requests for {retry_after} seconds.")
+            metrics.incr('rate_limit_pauses')
+            metrics.incr('rate_limit_pause_seconds', retry_after)
+            limiter.on_rate_limited(retry_after)
         else:
-            print(f"Attempt {attempt + 1} failed with status: {response.status_code}, {response.text}")
+            print(f"Attempt {attempt + 1} failed with status: {response.status_code}")
+            metrics.incr('retries')
             time.sleep(2 ** attempt)  # Retry with exponential backoff
+    metrics.incr('failed_requests')
     return None
 
 # Function to get the channel name
@@ -73,12 +135,12 @@ def get_channel_name(channel_id):
         print("Failed to fetch channel info after retries.")
     return 'channel'
 
-# Function to download all messages from the channel
-def fetch_all_messages(channel_id, oldest_time):
-    all_messages = []
+# Function to download the messages of the channel page by page (newest first).
+# Raises if a page cannot be fetched, so an incomplete export is never uploaded or checkpointed
+def fetch_message_pages(channel_id, oldest_time):
     next_cursor = None
 
-    print(f"Fetching messages from: {datetime.fromtimestamp(oldest_time)}")
+    print(f"[{channel_id}] Fetching messages from: {datetime.fromtimestamp(oldest_time)}")
 
     while True:
         params = {
@@ -90,130 +152,351 @@ def fetch_all_messages(channel_id, oldest_time):
         if next_cursor:
             params['cursor'] = next_cursor
 
-        response = make_request_with_retry(API_URL, params, headers)
+        with metrics.timer('conversations.history'):
+            response = make_request_with_retry(API_URL, params, headers)
 
         if response is None:
-            print("Failed to fetch messages after retries.")
-            break
+            raise RuntimeError("Failed to fetch messages after retries.")
 
-        print(f"API Response: {response.status_code}, {response.text}")
+        if DEBUG_RESPONSES:
+            print(f"API Response: {response.status_code}, {response.text}")
 
         if response.status_code == 200:
             data = response.json()
             if data.get('ok'):
                 messages = data.get('messages', [])
                 print(f"Fetched {len(messages)} messages.")
-                all_messages.extend(messages)
+                metrics.incr('history_pages')
+                metrics.incr('messages_fetched', len(messages))
+                yield messages
                 next_cursor = data.get('response_metadata', {}).get('next_cursor')
                 if not next_cursor:
-                    break
+                    return
             else:
-                print(f"Error fetching messages: {data.get('error')}")
-                break
+                raise RuntimeError(f"Error fetching messages: {data.get('error')}")
         else:
-            print(f"Error fetching messages: {response.status_code}, {response.text}")
-            break
-
-    return all_messages
+            raise RuntimeError(f"Error fetching messages: {response.status_code}, {response.text}")
 
-# Function to download messages from threads
+# Function to download messages from threads, following the reply cursor until the end.
+# Returns None if the thread could not be fetched completely.
 def fetch_thread_messages(channel_id, thread_ts, oldest_time):
     thread_messages = []
-    params = {
-        'channel': channel_id,
-        'ts': thread_ts,
-        'oldest': f"{oldest_time:.6f}",
-        'limit': 100
-    }
+    next_cursor = None
+
+    while True:
+        params = {
+            'channel': channel_id,
+            'ts': thread_ts,
+            'oldest': f"{oldest_time:.6f}",
+            'limit': 100
+        }
 
-    print(f"Fetching thread messages from: {datetime.fromtimestamp(oldest_time)} for thread_ts: {thread_ts}")
+        if next_cursor:
+            params['cursor'] = next_cursor
 
-    response = make_request_with_retry('https://slack.com/api/conversations.replies', params, headers)
+        with metrics.timer('conversations.replies'):
+            response = make_request_with_retry('https://slack.com/api/conversations.replies', params, headers)
 
-    if response is None:
-        print("Failed to fetch thread messages after retries.")
-        return thread_messages
+        if response is None:
+            print("Failed to fetch thread messages after retries.")
+            metrics.incr('failed_threads')
+            return None
 
-    print(f"Thread API Response: {response.status_code}, {response.text}")
+        if DEBUG_RESPONSES:
+            print(f"Thread API Response: {response.status_code}, {response.text}")
 
-    if response.status_code == 200:
-        data = response.json()
-        if data.get('ok'):
-            messages = data.get('messages', [])
-            print(f"Fetched {len(messages)} thread messages.")
-            thread_messages.extend(messages)
+        if response.status_code == 200:
+            data = response.json()
+            if data.get('ok'):
+                messages = data.get('messages', [])
+                metrics.incr('reply_pages')
+                metrics.incr('replies_fetched', len(messages))
+                thread_messages.extend(messages)
+                next_cursor = data.get('response_metadata', {}).get('next_cursor')
+                if not next_cursor:
+                    return thread_messages
+            else:
+                print(f"Error fetching thread messages: {data.get('error')}")
+                return None
         else:
-            print(f"Error fetching thread messages: {data.get('error')}")
-    else:
-        print(f"Error fetching thread messages: {response.status_code}, {response.text}")
-
-    return thread_messages
-
-# Check token validity
-if not check_token_validity():
-    print("Exiting the program due to invalid token.")
-    exit()
-
-# Unix timestamp for the last 24 hours
-current_time = time.time()
-yesterday_time = current_time - 24 * 60 * 60
-
-print(f"Current time: {current_time}, Yesterday time: {yesterday_time}")
-
-# Fetch all messages from the channel
-messages = fetch_all_messages(CHANNEL_ID, yesterday_time)
-data = []
-
-# Process messages and replies in threads
-for message in messages:
-    if 'text' in message:
-        data.append({
-            'timestamp': message.get('ts'),
-            'user': message.get('user', 'unknown'),
-            'text': message.get('text', ''),
-            'is_thread': 'No',
-            'thread_ts': ''
-        })
-
-        if 'thread_ts' in message:
-            thread_ts = message['thread_ts']
-            thread_messages = fetch_thread_messages(CHANNEL_ID, thread_ts, yesterday_time)
-            for idx, thread_message in enumerate(thread_messages):
-                data.append({
-                    'timestamp': thread_message.get('ts'),
-                    'user': thread_message.get('user', 'unknown'),
-                    'text': thread_message.get('text', ''),
-                    'is_thread': 'Yes' if idx != 0 else 'Original',
-                    'thread_ts': thread_ts
-                })
-
-# Get channel name
-channel_name = get_channel_name(CHANNEL_ID)
-
-# Get date to create file name
-today_date = datetime.now().strftime('%Y-%m-%d')
-object_name = f"{channel_name}-{today_date}.csv"
-
-# Write content to CSV in memory
-csv_content = io.StringIO()
-csv_file = csv.DictWriter(csv_content, fieldnames=['timestamp', 'user', 'text', 'is_thread', 'thread_ts'])
-csv_file.writeheader()
-csv_file.writerows(data)
-
-# Function to upload file to S3
-def upload_to_s3(content, bucket, object_name):
-    s3 = boto3.client(
+            print(f"Error fetching thread messages: {response.status_code}, {response.text}")
+            return None
+
+# Function to download the replies of many threads in parallel.
+# thread_requests is a list of (thread_ts, oldest_time), results keep its order
+def fetch_threads_concurrently(channel_id, thread_requests):
+    with ThreadPoolExecutor(max_workers=REPLY_FETCH_WORKERS) as executor:
+        return list(executor.map(lambda request: fetch_thread_messages(channel_id, *request), thread_requests))
+
+# Function to create the S3 client
+def get_s3_client():
+    import boto3
+    return boto3.client(
         's3',
         aws_access_key_id=AWS_ACCESS_KEY_ID,
         aws_secret_access_key=AWS_SECRET_ACCESS_KEY
     )
 
+# Function to load the channel checkpoint (last seen message ts and thread reply ts)
+def load_checkpoint(channel_id):
+    if CHECKPOINT_BUCKET:
+        from botocore.exceptions import ClientError
+        try:
+            response = get_s3_client().get_object(Bucket=CHECKPOINT_BUCKET, Key=f"checkpoints/{channel_id}.json")
+            return json.loads(response['Body'].read())
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'NoSuchKey':
+                return {}
+            raise
     try:
-        s3.put_object(Bucket=bucket, Key=object_name, Body=content.getvalue())
-        print(f"File '{object_name}' uploaded successfully to '{bucket}'")
+        with open(os.path.join(CHECKPOINT_DIR, f"{channel_id}.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+# Function to save the channel checkpoint once its export has been uploaded
+def save_checkpoint(channel_id, checkpoint):
+    body = json.dumps(checkpoint, indent=2)
+    if CHECKPOINT_BUCKET:
+        get_s3_client().put_object(Bucket=CHECKPOINT_BUCKET, Key=f"checkpoints/{channel_id}.json", Body=body)
+    else:
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        path = os.path.join(CHECKPOINT_DIR, f"{channel_id}.json")
+        with open(path + '.tmp', 'w') as f:
+            f.write(body)
+        os.replace(path + '.tmp', path)  # Atomic, a crash never leaves a half written checkpoint
+    print(f"Checkpoint saved for {channel_id}: last_ts={checkpoint['last_ts']}, "
+          f"last_reply_ts={checkpoint['last_reply_ts']}, {len(checkpoint.get('threads', {}))} threads tracked")
+
+# Function to list the channels to export: SLACK_CHANNEL_IDS, SLACK_CHANNEL_ID, or every channel
+# the bot is a member of (discovered with conversations.list) when neither is set.
+# Returns a list of (channel_id, channel_name or None)
+def list_channels():
+    if CHANNEL_IDS:
+        return [(channel_id, None) for channel_id in CHANNEL_IDS]
+
+    channels = []
+    next_cursor = None
+    while True:
+        params = {
+            'types': CHANNEL_TYPES,
+            'exclude_archived': 'true',
+            'limit': 200
+        }
+        if next_cursor:
+            params['cursor'] = next_cursor
+
+        with metrics.timer('conversations.list'):
+            response = make_request_with_retry('https://slack.com/api/conversations.list', params, headers)
+        if response is None:
+            raise RuntimeError("Failed to list channels after retries.")
+        data = response.json()
+        if not data.get('ok'):
+            raise RuntimeError(f"Error listing channels: {data.get('error')}")
+
+        for channel in data.get('channels', []):
+            # The bot can only read the history of channels it has joined
+            if channel.get('is_member') and channel.get('name', '').startswith(CHANNEL_NAME_PREFIX):
+                channels.append((channel['id'], channel['name']))
+        next_cursor = data.get('response_metadata', {}).get('next_cursor')
+        if not next_cursor:
+            return channels
+
+# Function to export one channel: fetch the messages since its checkpoint, stream them to S3 and
+# move its checkpoint forward. Returns the number of rows uploaded (0 if there was nothing new)
+def export_channel(channel_id, channel_name=None):
+    # Resume from the channel checkpoint, the first run falls back to the last 24 hours
+    current_time = time.time()
+    checkpoint = load_checkpoint(channel_id)
+    oldest_time = float(checkpoint.get('last_ts', current_time - INITIAL_LOOKBACK_HOURS * 60 * 60))
+    oldest_reply_time = float(checkpoint.get('last_reply_ts', oldest_time))
+
+    # Last known latest_reply per thread_ts, threads whose latest_reply did not change are skipped
+    thread_cache = checkpoint.get('threads', {})
+    # Re-list recent parents too (not only the delta), their latest_reply tells which threads have new replies
+    lookback_time = current_time - THREAD_LOOKBACK_DAYS * 24 * 60 * 60
+    scan_time = min(oldest_time, lookback_time) if checkpoint else oldest_time
+
+    print(f"[{channel_id}] Current time: {current_time}, Oldest time: {oldest_time}, "
+          f"Oldest reply time: {oldest_reply_time}")
+
+    # Get channel name
+    if not channel_name:
+        channel_name = get_channel_name(channel_id)
+
+    # Get date and time to create file name (several delta runs can happen on the same day)
+    today_date = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+    object_name = f"{channel_name}-{today_date}{EXPORT_FORMATS[EXPORT_FORMAT]}"
+
+    # Rows are encoded and streamed to S3 in multipart chunks while the next pages are fetched,
+    # so memory stays flat whatever the channel volume
+    s3_writer = S3MultipartWriter(get_s3_client(), BUCKET_NAME, object_name,
+                                  part_size=UPLOAD_PART_SIZE, max_concurrency=UPLOAD_CONCURRENCY)
+    export_file = io.BufferedWriter(s3_writer, buffer_size=64 * 1024)
+    row_writer = open_row_writer(EXPORT_FORMAT, export_file, ['timestamp', 'user', 'text', 'is_thread', 'thread_ts'])
+    kb_builder = None
+    if KB_DOCUMENTS:
+        kb_builder = KBDocumentBuilder(get_s3_client(), BUCKET_NAME, channel_id, channel_name,
+                                       docs_prefix=KB_DOCS_PREFIX, state_prefix=KB_STATE_PREFIX,
+                                       max_workers=REPLY_FETCH_WORKERS)
+    rows_written = 0
+    last_ts = oldest_time
+    last_reply_ts = oldest_reply_time
+    requested_threads = set()
+
+    # Function to send a row to the export and to the thread documents
+    def write_row(row):
+        with metrics.timer('encode'):
+            row_writer.write_row(row)
+        if kb_builder is not None:
+            kb_builder.add_row(row)
+        metrics.incr('rows_written')
+
+    try:
+        # Fetch the messages newer than the checkpoint and the recent thread parents
+        for messages in fetch_message_pages(channel_id, scan_time):
+            # Pick the threads that are new or have replies newer than the cached latest_reply
+            thread_requests = {}
+            for message in messages:
+                thread_ts = message.get('thread_ts')
+                if 'text' not in message or not thread_ts or thread_ts in requested_threads:
+                    continue
+                requested_threads.add(thread_ts)
+                cached_latest_reply = thread_cache.get(thread_ts)
+                if cached_latest_reply is not None and cached_latest_reply == message.get('latest_reply'):
+                    continue
+                thread_requests[thread_ts] = float(cached_latest_reply) if cached_latest_reply else oldest_reply_time
+
+            print(f"[{channel_id}] {len(thread_requests)} threads with new replies to fetch on this page.")
+
+            # Fetch the replies of those threads in parallel
+            threads = dict(zip(thread_requests,
+                               fetch_threads_concurrently(channel_id, list(thread_requests.items()))))
+
+            # Process messages and replies in threads
+            for message in messages:
+                if 'text' in message:
+                    if float(message['ts']) > oldest_time:
+                        write_row({
+                            'timestamp': message.get('ts'),
+                            'user': message.get('user', 'unknown'),
+                            'text': message.get('text', ''),
+                            'is_thread': 'No',
+                            'thread_ts': ''
+                        })
+                        rows_written += 1
+                        last_ts = max(last_ts, float(message['ts']))
+
+                    thread_ts = message.get('thread_ts')
+                    if thread_ts in threads:
+                        thread_messages = threads.pop(thread_ts)
+                        if thread_messages is None:
+                            # Fetch failed: retry from the same point next run
+                            thread_cache[thread_ts] = f"{thread_requests[thread_ts]:.6f}"
+                            continue
+                        for thread_message in thread_messages:
+                            is_original = thread_message.get('ts') == thread_ts
+                            write_row({
+                                'timestamp': thread_message.get('ts'),
+                                'user': thread_message.get('user', 'unknown'),
+                                'text': thread_message.get('text', ''),
+                                'is_thread': 'Original' if is_original else 'Yes',
+                                'thread_ts': thread_ts
+                            })
+                            rows_written += 1
+                            if not is_original:
+                                last_reply_ts = max(last_reply_ts, float(thread_message['ts']))
+                        thread_cache[thread_ts] = message.get('latest_reply') or max(
+                            [thread_message['ts'] for thread_message in thread_messages] + [thread_ts], key=float)
+
+            # Upload the thread documents touched by this page
+            if kb_builder is not None:
+                with metrics.timer('kb_documents'):
+                    kb_builder.flush()
+
+        if not rows_written:
+            print(f"[{channel_id}] No new messages since the last checkpoint, nothing to upload.")
+            return 0
+
+        # Upload the last part and publish the object
+        with metrics.timer('s3_upload'):
+            row_writer.close()
+            export_file.flush()
+            s3_writer.complete()
+        metrics.incr('bytes_uploaded', s3_writer.bytes_written)
+        print(f"File '{object_name}' uploaded successfully to '{BUCKET_NAME}' ({s3_writer.bytes_written} bytes)")
+        if kb_builder is not None:
+            print(f"[{channel_id}] KB documents: {kb_builder.uploaded} uploaded, {kb_builder.unchanged} unchanged")
+            metrics.incr('kb_documents_uploaded', kb_builder.uploaded)
+            metrics.incr('kb_documents_unchanged', kb_builder.unchanged)
+    finally:
+        # Discards the multipart upload unless it was completed above
+        s3_writer.close()
+
+    # Forget threads whose parent has left the lookback window
+    thread_cache = {thread_ts: latest_reply for thread_ts, latest_reply in thread_cache.items()
+                    if float(thread_ts) >= lookback_time}
+
+    # Move the checkpoint forward only now that the upload succeeded
+    save_checkpoint(channel_id, {
+        'last_ts': f"{last_ts:.6f}",
+        'last_reply_ts': f"{last_reply_ts:.6f}",
+        'threads': thread_cache,
+        'updated_at': datetime.now().isoformat()
+    })
+    return rows_written
+
+# Function to export one channel without letting its failure stop the other channels.
+# Returns the number of rows uploaded, or None if the export failed
+def export_channel_isolated(channel_id, channel_name=None):
+    from botocore.exceptions import NoCredentialsError
+    try:
+        with metrics.timer('channel'):
+            return export_channel(channel_id, channel_name)
+    except NoCredentialsError:
+        raise  # Every channel would fail the same way
+    except Exception as e:
+        # Nothing was published and the checkpoint did not move, the next run retries this channel
+        print(f"[{channel_id}] Export failed: {e}")
+        return None
+
+# Function to run the export: every configured (or discovered) channel in parallel
+def main():
+    atexit.register(metrics.report, METRICS_JSON_FILE, METRICS_PROM_FILE)
+
+    # Check token validity
+    if not check_token_validity():
+        print("Exiting the program due to invalid token.")
+        return 1
+
+    channels = list_channels()
+    print(f"Exporting {len(channels)} channels with {min(CHANNEL_WORKERS, len(channels) or 1)} workers.")
+
+    # Channels run in parallel, every Slack call still draws from the shared per-method rate limiter
+    from botocore.exceptions import NoCredentialsError
+    try:
+        with ThreadPoolExecutor(max_workers=CHANNEL_WORKERS) as executor:
+            results = dict(zip([channel_id for channel_id, _ in channels],
+                               executor.map(lambda channel: export_channel_isolated(*channel), channels)))
     except NoCredentialsError:
         print("Credentials not available.")
-
-# Upload the CSV to S3
-bucket_name = 'kb-team4u'
-upload_to_s3(csv_content, bucket_name, object_name)
+        return 1
+
+    failed = [channel_id for channel_id, rows in results.items() if rows is None]
+    exported = [channel_id for channel_id, rows in results.items() if rows]
+    metrics.incr('channels_exported', len(exported))
+    metrics.incr('channels_unchanged', len(results) - len(exported) - len(failed))
+    metrics.incr('channels_failed', len(failed))
+
+    # New KB content: drop cached bot answers (KB_VERSION_LOCATION, shared with the bots).
+    # Bedrock only serves it after the ingestion sync: call notify_kb_updated() again once the sync completes
+    if exported:
+        notify_kb_updated(make_version_store(s3=get_s3_client()))
+
+    if failed:
+        print(f"{len(failed)} of {len(channels)} channels failed: {', '.join(failed)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryDedupStore:
+    """Per-process store of recently seen keys, bounded by size and age.
+
+    Keys are kept in insertion order, so expired or overflowing keys are
+    evicted from the front in O(1) and membership is a dict lookup.
+    """
+
+    def __init__(self, ttl=60 * 60, max_size=10000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clock = clock
+        self._seen = OrderedDict()  # key -> expires_at, oldest first
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        while self._seen:
+            key, expires_at = next(iter(self._seen.items()))
+            if expires_at > now and len(self._seen) <= self.max_size:
+                break
+            self._seen.popitem(last=False)
+
+    def add(self, key):
+        # Record the key, return True if it was not seen within the TTL
+        now = self._clock()
+        with self._lock:
+            self._evict(now)
+            if key in self._seen:
+                return False
+            self._seen[key] = now + self.ttl
+            self._evict(now)
+            return True
+
+    def __contains__(self, key):
+        now = self._clock()
+        with self._lock:
+            self._evict(now)
+            return key in self._seen
+
+    def __len__(self):
+        with self._lock:
+            return len(self._seen)
+
+
+class SQLiteDedupStore:
+    """Store shared by every process that opens the same SQLite file.
+
+    Lets several gunicorn workers on one host dedupe against each other.
+    Expired rows are purged periodically and the table is capped at max_size.
+    """
+
+    def __init__(self, path, ttl=60 * 60, max_size=100000, purge_every=500):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.purge_every = purge_every
+        self._local = threading.local()
+        self._adds = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS processed_events (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS processed_events_expires ON processed_events (expires_at)")
+
+    def _connect(self):
+        # sqlite3 connections cannot be shared between threads, keep one per thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def add(self, key):
+        # Record the key, return True if no process has seen it within the TTL
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM processed_events WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = conn.execute("INSERT OR IGNORE INTO processed_events (key, expires_at) VALUES (?, ?)",
+                                  (key, now + self.ttl))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        self._adds += 1
+        if self._adds % self.purge_every == 0:
+            self.purge(now)
+        return cursor.rowcount == 1
+
+    def purge(self, now=None):
+        now = time.time() if now is None else now
+        conn = self._connect()
+        conn.execute("DELETE FROM processed_events WHERE expires_at <= ?", (now,))
+        conn.execute(
+            "DELETE FROM processed_events WHERE key IN ("
+            "SELECT key FROM processed_events ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_size,)
+        )
+
+    def __contains__(self, key):
+        row = self._connect().execute("SELECT 1 FROM processed_events WHERE key = ? AND expires_at > ?",
+                                      (key, time.time())).fetchone()
+        return row is not None
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM processed_events").fetchone()[0]
+
+
+class RedisDedupStore:
+    """Store shared between hosts, backed by Redis keys with an expiry."""
+
+    def __init__(self, url, ttl=60 * 60, prefix="slackbot:event:"):
+        import redis  # Optional dependency, only needed for this backend
+        self._redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def add(self, key):
+        return bool(self._redis.set(self.prefix + key, 1, nx=True, ex=self.ttl))
+
+    def __contains__(self, key):
+        return bool(self._redis.exists(self.prefix + key))
+
+
+def make_dedup_store():
+    # Pick the dedup backend from the environment: memory (default), sqlite or redis
+    backend = os.getenv('DEDUP_BACKEND', 'memory').lower()
+    ttl = int(os.getenv('DEDUP_TTL', str(60 * 60)))
+
+    if backend == 'sqlite':
+        path = os.getenv('DEDUP_SQLITE_PATH', 'processed_events.sqlite3')
+        logger.info(f"Using SQLite dedup store at {path}")
+        return SQLiteDedupStore(path, ttl=ttl, max_size=int(os.getenv('DEDUP_MAX_SIZE', "100000")))
+    if backend == 'redis':
+        logger.info("Using Redis dedup store")
+        return RedisDedupStore(os.getenv('DEDUP_REDIS_URL', 'redis://localhost:6379/0'), ttl=ttl)
+    return MemoryDedupStore(ttl=ttl, max_size=int(os.getenv('DEDUP_MAX_SIZE', "10000")))
@@ -0,0 +1,112 @@
+import csv
+import gzip
+import io
+import json
+
+# Supported export formats and the file extension they are written with
+EXPORT_FORMATS = {
+    'csv': '.csv',
+    'jsonl': '.jsonl',
+    'jsonl.gz': '.jsonl.gz',
+    'jsonl.zst': '.jsonl.zst',
+    'parquet': '.parquet',
+}
+
+
+class CsvRowWriter:
+    def __init__(self, fileobj, fieldnames):
+        self._text = io.TextIOWrapper(fileobj, encoding='utf-8', newline='', write_through=True)
+        self._writer = csv.DictWriter(self._text, fieldnames=fieldnames)
+        self._writer.writeheader()
+
+    def write_row(self, row):
+        self._writer.writerow(row)
+
+    def close(self):
+        self._text.flush()
+        self._text.detach()  # Leave the underlying file open for the caller
+
+
+class JsonlRowWriter:
+    # One JSON object per line, optionally gzip or zstd compressed as it is written
+
+    def __init__(self, fileobj, fieldnames, compression=None):
+        self._fieldnames = fieldnames
+        self._compressor = None
+        if compression == 'gzip':
+            self._compressor = gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=6)
+            self._out = self._compressor
+        elif compression == 'zstd':
+            import zstandard  # Optional dependency: pip install zstandard
+            self._compressor = zstandard.ZstdCompressor(level=3).stream_writer(fileobj, closefd=False)
+            self._out = self._compressor
+        else:
+            self._out = fileobj
+
+    def write_row(self, row):
+        record = {name: row.get(name, '') for name in self._fieldnames}
+        self._out.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+
+    def close(self):
+        if self._compressor is not None:
+            self._compressor.close()  # Writes the compression trailer, does not close fileobj
+
+
+class ParquetRowWriter:
+    """Columnar output written one row group at a time.
+
+    Rows are buffered up to row_group_size, sorted by sort_keys and written
+    as a row group, so memory is bounded by one row group whatever the export size.
+    """
+
+    def __init__(self, fileobj, fieldnames, sort_keys=('thread_ts', 'timestamp'), row_group_size=50000,
+                 compression='zstd'):
+        import pyarrow as pa  # Optional dependency: pip install pyarrow
+        import pyarrow.parquet as pq
+        self._pa = pa
+        self._fieldnames = fieldnames
+        self._sort_keys = [key for key in sort_keys if key in fieldnames]
+        self._row_group_size = row_group_size
+        self._rows = []
+        self._schema = pa.schema([(name, pa.string()) for name in fieldnames])
+
+        options = {'compression': compression}
+        if self._sort_keys and hasattr(pq, 'SortingColumn'):
+            # Record the sort order in the file metadata so readers can skip row groups
+            options['sorting_columns'] = pq.SortingColumn.from_ordering(
+                self._schema, [(key, 'ascending') for key in self._sort_keys])
+        self._writer = pq.ParquetWriter(fileobj, self._schema, **options)
+
+    def write_row(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self._row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+        self._rows.sort(key=lambda row: tuple(row.get(key) or '' for key in self._sort_keys))
+        columns = {name: [None if row.get(name) is None else str(row[name]) for row in self._rows]
+                   for name in self._fieldnames}
+        self._writer.write_table(self._pa.Table.from_pydict(columns, schema=self._schema))
+        self._rows = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+def open_row_writer(export_format, fileobj, fieldnames, sort_keys=('thread_ts', 'timestamp')):
+    # Row writer for the given format over a binary file object. close() finishes
+    # the format (trailer, footer) but leaves fileobj open.
+    if export_format == 'csv':
+        return CsvRowWriter(fileobj, fieldnames)
+    if export_format == 'jsonl':
+        return JsonlRowWriter(fileobj, fieldnames)
+    if export_format == 'jsonl.gz':
+        return JsonlRowWriter(fileobj, fieldnames, compression='gzip')
+    if export_format == 'jsonl.zst':
+        return JsonlRowWriter(fileobj, fieldnames, compression='zstd')
+    if export_format == 'parquet':
+        return ParquetRowWriter(fileobj, fieldnames, sort_keys=sort_keys)
+    raise ValueError(f"Unknown export format '{export_format}', expected one of {', '.join(EXPORT_FORMATS)}")
@@ -0,0 +1,89 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    """Counters and stage timers for a batch job, safe to update from worker threads.
+
+    report() prints a JSON summary and can also write it to a file and to a
+    Prometheus textfile-collector file.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.started = time.time()
+        self.counters = {}
+        self.timings = {}  # stage -> {'count', 'seconds', 'max_seconds'}
+        self._lock = threading.Lock()
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                timing = self.timings.setdefault(stage, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+                timing['count'] += 1
+                timing['seconds'] += elapsed
+                timing['max_seconds'] = max(timing['max_seconds'], elapsed)
+
+    def summary(self):
+        with self._lock:
+            return {
+                'job': self.job,
+                'started_at': self.started,
+                'duration_seconds': round(time.time() - self.started, 3),
+                'counters': dict(self.counters),
+                'timings': {stage: {key: round(value, 6) for key, value in timing.items()}
+                            for stage, timing in self.timings.items()},
+            }
+
+    def prometheus_text(self):
+        # One HELP and TYPE line per metric family. Counters (running totals of this run) end in _total
+        summary = self.summary()
+        labels = f'job="{self.job}"'
+        lines = []
+
+        def family(name, metric_type, help_text, samples):
+            lines.append(f"# HELP {self.job}_{name} {help_text}")
+            lines.append(f"# TYPE {self.job}_{name} {metric_type}")
+            for sample_labels, value in samples:
+                lines.append(f"{self.job}_{name}{{{sample_labels}}} {value}")
+
+        family('duration_seconds', 'gauge', "Duration of the last run.", [(labels, summary['duration_seconds'])])
+        family('last_run_timestamp_seconds', 'gauge', "Start time of the last run, in seconds since the epoch.",
+               [(labels, summary['started_at'])])
+        for name, value in sorted(summary['counters'].items()):
+            family(f"{name}_total", 'counter', f"Total {name.replace('_', ' ')} in the last run.", [(labels, value)])
+
+        stages = sorted(summary['timings'].items())
+        if stages:
+            stage_labels = {stage: f'{labels},stage="{stage}"' for stage, _ in stages}
+            family('stage_seconds_total', 'counter', "Time spent in each stage in the last run.",
+                   [(stage_labels[stage], timing['seconds']) for stage, timing in stages])
+            family('stage_calls_total', 'counter', "Calls of each stage in the last run.",
+                   [(stage_labels[stage], timing['count']) for stage, timing in stages])
+            family('stage_max_seconds', 'gauge', "Longest call of each stage in the last run.",
+                   [(stage_labels[stage], timing['max_seconds']) for stage, timing in stages])
+        return '\n'.join(lines) + '\n'
+
+    def report(self, json_path=None, prometheus_path=None):
+        summary = json.dumps(self.summary(), indent=2)
+        print(summary)
+        if json_path:
+            with open(json_path, 'w') as f:
+                f.write(summary)
+        if prometheus_path:
+            # Write then rename, the node exporter must never read a partial file
+            with open(prometheus_path + '.tmp', 'w') as f:
+                f.write(self.prometheus_text())
+            os.replace(prometheus_path + '.tmp', prometheus_path)
@@ -0,0 +1,99 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Summarise `python -X importtime` for the team4U scripts: what importing each one costs and which
+# packages it pays for, without the interpreter startup. Importing must be side-effect free (no .env
+# loading, no network calls).
+#   python importtime_report.py [module ...] [--top 10] [--json importtime.json]
+
+# The bots build their Slack apps in create_app(), so importing them measures only the code they load
+DEFAULT_MODULES = ['data_slack_file_to_bucket', 'load_slack_channel_to_csv', 'upload_file_to_s3',
+                   'ping_pong_bedrock', 'model_according_to_KB', 'slackbot', 'slackbot_async']
+
+
+def parse_importtime(stderr):
+    # (self_us, cumulative_us, depth, name) for every "import time:" line
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return entries
+
+
+def module_entries(entries, module):
+    # The row of module and the rows of the imports it triggered (printed just before it, nested
+    # deeper). Interpreter startup (site, encodings, ...) is a sibling of the module and left out
+    for index, (_, _, depth, name) in enumerate(entries):
+        if depth == 0 and name == module:
+            start = index
+            while start > 0 and entries[start - 1][2] > 0:
+                start -= 1
+            return entries[start:index + 1]
+    return []
+
+
+def profile_module(module, runs, cwd):
+    # Import the module in fresh interpreters, return the summary of the median run
+    samples = []
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                   cwd=cwd, capture_output=True, text=True)
+        if completed.returncode != 0:
+            error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else 'failed'
+            return {'module': module, 'error': error}
+        entries = module_entries(parse_importtime(completed.stderr), module)
+        if not entries:
+            return {'module': module, 'error': 'no import time row for the module'}
+        total = entries[-1][1]  # Cumulative time of the module's own row
+        samples.append((total, entries))
+
+    samples.sort(key=lambda sample: sample[0])
+    total, entries = samples[len(samples) // 2]
+    # Self time grouped by top-level package: who the import pays for
+    packages = {}
+    for self_us, _, _, name in entries:
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us
+    return {
+        'module': module,
+        'total_ms': round(total / 1000, 1),
+        'median_of_runs_ms': round(statistics.median(sample[0] for sample in samples) / 1000, 1),
+        'modules_imported': len(entries),
+        'packages_ms': {package: round(self_us / 1000, 1)
+                        for package, self_us in sorted(packages.items(), key=lambda item: -item[1])},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time profile of the team4U scripts (-X importtime)")
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES, help="Modules to profile")
+    parser.add_argument('--runs', type=int, default=3, help="Fresh interpreter runs per module (default: 3)")
+    parser.add_argument('--top', type=int, default=8, help="Heaviest packages listed per module (default: 8)")
+    parser.add_argument('--json', help="Also write the full report to this file")
+    args = parser.parse_args()
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    report = [profile_module(module, args.runs, cwd) for module in args.modules]
+
+    for result in report:
+        if 'error' in result:
+            print(f"{result['module']:<28} import failed: {result['error']}")
+            continue
+        heaviest = ', '.join(f"{package} {ms}" for package, ms in list(result['packages_ms'].items())[:args.top])
+        print(f"{result['module']:<28} {result['total_ms']:>8.1f} ms  {result['modules_imported']:>4} modules  "
+              f"({heaviest})")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
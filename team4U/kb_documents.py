@@ -0,0 +1,85 @@
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+def render_document(channel_name, messages):
+    # Plain text document for one thread: the original question followed by its replies
+    lines = [f"Slack thread in #{channel_name}"]
+    for index, message in enumerate(messages):
+        when = datetime.fromtimestamp(float(message['timestamp'])).strftime('%Y-%m-%d %H:%M')
+        label = 'Question' if index == 0 else 'Reply'
+        lines.append(f"{label} ({when}, {message['user']}): {message['text']}")
+    return '\n\n'.join(lines) + '\n'
+
+
+class KBDocumentBuilder:
+    """Groups exported rows into one knowledge base document per thread.
+
+    Documents live under stable keys (<docs_prefix><channel_id>/<thread_ts>.txt).
+    The messages and content hash of each document are kept next to it under
+    state_prefix, so new replies are merged into the existing document and a
+    document is only uploaded when its content hash changes. The KB data source
+    should include docs_prefix only.
+    """
+
+    def __init__(self, s3, bucket, channel_id, channel_name, docs_prefix='kb-docs/', state_prefix='kb-state/',
+                 max_workers=8):
+        self.s3 = s3
+        self.bucket = bucket
+        self.channel_id = channel_id
+        self.channel_name = channel_name
+        self.docs_prefix = docs_prefix
+        self.state_prefix = state_prefix
+        self.max_workers = max_workers
+        self.uploaded = 0
+        self.unchanged = 0
+        self._pending = {}  # thread_ts -> {ts: row}
+
+    def add_row(self, row):
+        if not row.get('text'):
+            return
+        thread_ts = row.get('thread_ts') or row['timestamp']
+        self._pending.setdefault(thread_ts, {})[row['timestamp']] = {
+            'timestamp': row['timestamp'],
+            'user': row.get('user', 'unknown'),
+            'text': row['text'],
+        }
+
+    def flush(self):
+        # Merge and upload the documents of the threads added since the last flush
+        pending, self._pending = self._pending, {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(lambda item: self._update_document(*item), pending.items()))
+        self.uploaded += sum(results)
+        self.unchanged += len(results) - sum(results)
+
+    def _update_document(self, thread_ts, new_messages):
+        state_key = f"{self.state_prefix}{self.channel_id}/{thread_ts}.json"
+        state = self._load_state(state_key)
+
+        messages = {message['timestamp']: message for message in state.get('messages', [])}
+        messages.update(new_messages)
+        ordered = sorted(messages.values(), key=lambda message: float(message['timestamp']))
+
+        document = render_document(self.channel_name, ordered)
+        content_hash = hashlib.sha256(document.encode('utf-8')).hexdigest()
+        if content_hash == state.get('sha256'):
+            return False
+
+        self.s3.put_object(Bucket=self.bucket, Key=f"{self.docs_prefix}{self.channel_id}/{thread_ts}.txt",
+                           Body=document.encode('utf-8'), ContentType='text/plain; charset=utf-8',
+                           Metadata={'sha256': content_hash})
+        self.s3.put_object(Bucket=self.bucket, Key=state_key,
+                           Body=json.dumps({'sha256': content_hash, 'messages': ordered}).encode('utf-8'))
+        return True
+
+    def _load_state(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            return json.loads(self.s3.get_object(Bucket=self.bucket, Key=key)['Body'].read())
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'NoSuchKey':
+                return {}
+            raise
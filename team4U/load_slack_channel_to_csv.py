@@ -1,48 +1,72 @@
-# pip install slack-sdk
+# pip install requests
 # pip install python-dotenv
 
 
-import csv
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
+from concurrent.futures import ThreadPoolExecutor
 import os
-from dotenv import load_dotenv
 
 # טען את משתני הסביבה מקובץ .env
-load_dotenv(dotenv_path='.env')  # וודא שהקובץ נטען
+# Before slack_http, which (with slack_rate_limit) reads its settings at import
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path='.env')  # וודא שהקובץ נטען
+
+from slack_http import slack_api_get, SlackApiError
+from export_formats import open_row_writer, EXPORT_FORMATS
 
 # השתמש במשתנים
 SLACK_BOT_TOKEN = os.getenv('SLACK_BOT_TOKEN')
 SLACK_CHANNEL_ID = os.getenv('SLACK_CHANNEL_ID')
 
-print(SLACK_BOT_TOKEN)
-print(SLACK_CHANNEL_ID)
-print("hello team4U")
+# Output format: csv, jsonl, jsonl.gz, jsonl.zst or parquet
+EXPORT_FORMAT = os.getenv('EXPORT_FORMAT', 'csv')
+OUTPUT_FILE = 'slack_messages' + EXPORT_FORMATS[EXPORT_FORMAT]
+FIELDNAMES = ['timestamp', 'user', 'text', 'reply_to', 'reply_text']
+
+# Number of threads whose replies are fetched in parallel
+REPLY_FETCH_WORKERS = int(os.getenv('REPLY_FETCH_WORKERS', '8'))
 
-# Create a WebClient object with your token
-client = WebClient(token=SLACK_BOT_TOKEN)
+
+def fetch_replies(channel_id, thread_ts):
+    # Follow the reply cursor so long threads are not truncated
+    replies = []
+    cursor = None
+    while True:
+        # All calls share one pooled keep-alive session and the Slack rate limiter
+        reply_response = slack_api_get('conversations.replies', SLACK_BOT_TOKEN, channel=channel_id, ts=thread_ts,
+                                       cursor=cursor, limit=200)
+        replies.extend(reply_response['messages'])
+        cursor = reply_response.get('response_metadata', {}).get('next_cursor')
+        if not cursor:
+            return replies
 
 
 def fetch_channel_history(channel_id):
     try:
-        # Open a CSV file for writing
-        with open('slack_messages.csv', mode='w', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
-            # Write header row
-            writer.writerow(['timestamp', 'user', 'text', 'reply_to', 'reply_text'])
+        # Open the output file for writing, rows are encoded as they are fetched
+        with open(OUTPUT_FILE, mode='wb') as file:
+            writer = open_row_writer(EXPORT_FORMAT, file, FIELDNAMES, sort_keys=('reply_to', 'timestamp'))
 
             # Initialize the cursor for pagination
             cursor = None
 
             while True:
                 # Request channel history with cursor for pagination
-                response = client.conversations_history(
+                response = slack_api_get(
+                    'conversations.history',
+                    SLACK_BOT_TOKEN,
                     channel=channel_id,
                     cursor=cursor,
                     limit=200  # You can adjust this number to fetch up to 200 messages per request
                 )
                 messages = response['messages']
 
+                # Fetch the replies of every thread on this page in parallel, keeping the page order
+                thread_ts_list = [message['thread_ts'] for message in messages if 'thread_ts' in message]
+                with ThreadPoolExecutor(max_workers=REPLY_FETCH_WORKERS) as executor:
+                    thread_replies = dict(zip(thread_ts_list, executor.map(
+                        lambda thread_ts: fetch_replies(channel_id, thread_ts), thread_ts_list)))
+
                 # Create a dictionary to store messages by timestamp
                 message_dict = {}
                 for message in messages:
@@ -62,20 +86,19 @@ def fetch_channel_history(channel_id):
                     # Check if the message has replies
                     if 'thread_ts' in message:
                         thread_ts = message['thread_ts']
-                        # Fetch replies for this thread
-                        reply_response = client.conversations_replies(channel=channel_id, ts=thread_ts)
-                        replies = reply_response['messages']
+                        # Replies for this thread were fetched above
+                        replies = thread_replies[thread_ts]
 
                         # Add replies to the corresponding original message
                         for reply in replies:
                             if reply.get('ts') != thread_ts:  # Skip the original message itself
                                 reply_texts.append(reply.get('text', ''))
                                 reply_timestamp = reply.get('ts', '')
-                                writer.writerow([reply_timestamp, reply.get('user', ''), '', thread_ts, reply.get('text', '')])
+                                writer.write_row(dict(zip(FIELDNAMES, [reply_timestamp, reply.get('user', ''), '', thread_ts, reply.get('text', '')])))
                                 print(f'Reply Timestamp: {reply_timestamp}, Reply User: {reply.get("user", "")}, Reply Text: {reply.get("text", "")}, Reply To: {thread_ts}')
 
                     # Write the original message
-                    writer.writerow([timestamp, user, text, '', ''])
+                    writer.write_row(dict(zip(FIELDNAMES, [timestamp, user, text, '', ''])))
                     print(f'Timestamp: {timestamp}, User: {user}, Text: {text}, Reply To: {reply_to}')
 
                 # Check if there's more messages to fetch
@@ -83,11 +106,21 @@ def fetch_channel_history(channel_id):
                 if not cursor:
                     break
 
-        print("Messages and replies saved to slack_messages.csv successfully.")
+            writer.close()
+
+        print(f"Messages and replies saved to {OUTPUT_FILE} successfully.")
 
     except SlackApiError as e:
-        print(f"Error fetching conversations: {e.response['error']}")
+        print(f"Error fetching conversations: {e.error}")
+
+
+def main():
+    print(SLACK_CHANNEL_ID)
+    print("hello team4U")
+
+    # Call the function with the channel ID
+    fetch_channel_history(SLACK_CHANNEL_ID)
 
 
-# Call the function with the channel ID
-fetch_channel_history(SLACK_CHANNEL_ID)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
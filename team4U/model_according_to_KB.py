@@ -1,45 +1,417 @@
-import boto3
 import logging
 import sys
 import os
-from dotenv import load_dotenv
-load_dotenv(dotenv_path='.env')
+import csv
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# The bot loads .env itself before importing this module; the CLI loads it here,
+# before slack_rate_limit reads its settings at import
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path='.env')
+
+from answer_cache import AnswerCache, make_version_store
+from slack_rate_limit import AdaptiveTokenBucket
 
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Connection pool and retry settings for the shared Bedrock client
+BEDROCK_REGION = os.getenv('BEDROCK_REGION', "us-east-1")  # שנה בהתאם
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.getenv('BEDROCK_MAX_POOL_CONNECTIONS', "20"))
+BEDROCK_MAX_ATTEMPTS = int(os.getenv('BEDROCK_MAX_ATTEMPTS', "4"))
+BEDROCK_READ_TIMEOUT = int(os.getenv('BEDROCK_READ_TIMEOUT', "60"))
 
-def query_knowledge_base(message):
-    bedrock_agent_runtime = boto3.client('bedrock-agent-runtime',
-                                         aws_access_key_id=os.getenv('aws_access_key_id'),
-                                         aws_secret_access_key=os.getenv('aws_secret_access_key'),
-                                         region_name="us-east-1" ) # שנה בהתאם)
+_bedrock_agent_runtime = None
+_bedrock_runtime = None
+_bedrock_client_lock = threading.Lock()
+
+KNOWLEDGE_BASE_ID = "IFGNAI9DOT"
+MODEL_ARN = "anthropic.claude-3-5-sonnet-20240620-v1:0"
+
+# Fast path: retrieve first, and when the best passage scores above KB_FAST_PATH_MIN_SCORE answer from it
+# ('passage': return it as is, 'generate': answer with the smaller KB_FAST_MODEL_ID over the top passages).
+# Lower scores fall back to retrieve_and_generate with MODEL_ARN
+KB_FAST_PATH = os.getenv('KB_FAST_PATH', "false").lower() == "true"
+KB_FAST_PATH_MODE = os.getenv('KB_FAST_PATH_MODE', "generate")
+KB_FAST_PATH_MIN_SCORE = float(os.getenv('KB_FAST_PATH_MIN_SCORE', "0.75"))
+KB_FAST_MODEL_ID = os.getenv('KB_FAST_MODEL_ID', "anthropic.claude-3-haiku-20240307-v1:0")
+KB_RETRIEVE_RESULTS = int(os.getenv('KB_RETRIEVE_RESULTS', "5"))
+NO_ANSWER = "NO_ANSWER"
+
+# Answer cache in front of retrieve_and_generate for repeated questions
+KB_CACHE_ENABLED = os.getenv('KB_CACHE_ENABLED', "true").lower() == "true"
+KB_CACHE_SIMILARITY = os.getenv('KB_CACHE_SIMILARITY')  # e.g. 0.85, unset = exact match only
+answer_cache = AnswerCache(
+    max_size=int(os.getenv('KB_CACHE_MAX_SIZE', "512")),
+    ttl=int(os.getenv('KB_CACHE_TTL', str(6 * 60 * 60))),
+    similarity_threshold=float(KB_CACHE_SIMILARITY) if KB_CACHE_SIMILARITY else None,
+    version_store=make_version_store(),  # KB_VERSION_LOCATION, shared with the exporter
+    version_poll_interval=float(os.getenv('KB_VERSION_POLL_INTERVAL', "30"))
+)
+
+
+def create_bedrock_client(service_name):
+    # boto3 is imported with the first client, not when the bot imports this module
+    import boto3
+    from botocore.config import Config
+    config = Config(
+        max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        read_timeout=BEDROCK_READ_TIMEOUT,
+        retries={'max_attempts': BEDROCK_MAX_ATTEMPTS, 'mode': 'adaptive'}
+    )
+    return boto3.client(service_name,
+                        aws_access_key_id=os.getenv('aws_access_key_id'),
+                        aws_secret_access_key=os.getenv('aws_secret_access_key'),
+                        region_name=BEDROCK_REGION,
+                        config=config)
+
+
+def get_bedrock_agent_runtime():
+    # Create the bedrock-agent-runtime client once and share it between threads.
+    # boto3 clients are thread-safe, so the bot workers and the CLI all reuse
+    # the same credentials, endpoint data and pooled keep-alive connections.
+    global _bedrock_agent_runtime
+    if _bedrock_agent_runtime is None:
+        with _bedrock_client_lock:
+            if _bedrock_agent_runtime is None:
+                _bedrock_agent_runtime = create_bedrock_client('bedrock-agent-runtime')
+    return _bedrock_agent_runtime
+
+
+def get_bedrock_runtime():
+    # Shared bedrock-runtime client, used by the fast path to call the smaller model
+    global _bedrock_runtime
+    if _bedrock_runtime is None:
+        with _bedrock_client_lock:
+            if _bedrock_runtime is None:
+                _bedrock_runtime = create_bedrock_client('bedrock-runtime')
+    return _bedrock_runtime
+
+
+def warm_up():
+    # Pay the client cold start (model loading, endpoint and credential resolution)
+    # once at process start instead of on the first question
+    try:
+        client = get_bedrock_agent_runtime()
+        logger.info(f"Bedrock agent runtime client ready ({client.meta.endpoint_url})")
+        if KB_FAST_PATH and KB_FAST_PATH_MODE == 'generate':
+            get_bedrock_runtime()
+    except Exception as e:
+        logger.error(f"Failed to warm up Bedrock client: {e}")
+
+
+def get_cached_answer(message):
+    if not KB_CACHE_ENABLED:
+        return None
+    cached_answer = answer_cache.get(message)
+    if cached_answer is not None:
+        logger.info(f"Answer cache hit {answer_cache.stats()}")
+    else:
+        logger.info(f"Answer cache miss {answer_cache.stats()}")
+    return cached_answer
 
-    request_body = {
+
+def build_request(message, session_id=None):
+    request = {
         "input": {
             "text": message
         },
         "retrieveAndGenerateConfiguration": {
             "type": "KNOWLEDGE_BASE",
             "knowledgeBaseConfiguration": {
-                "knowledgeBaseId": "IFGNAI9DOT",
-                "modelArn": "anthropic.claude-3-5-sonnet-20240620-v1:0"
+                "knowledgeBaseId": KNOWLEDGE_BASE_ID,
+                "modelArn": MODEL_ARN
             }
         }
     }
+    if session_id:
+        # Continue the conversation: Bedrock keeps the earlier turns server side
+        request["sessionId"] = session_id
+    return request
+
+
+def is_invalid_session_error(error):
+    # Bedrock rejects a session that expired or belongs to another knowledge base configuration
+    from botocore.exceptions import ClientError
+    if not isinstance(error, ClientError):
+        return False
+    details = error.response['Error']
+    return details['Code'] in ('ValidationException', 'ResourceNotFoundException') and \
+        'session' in details.get('Message', '').lower()
+
+
+def call_in_session(operation, message, session_id):
+    # Call retrieve_and_generate(_stream) in the session, or in a new one if Bedrock no longer knows it
+    try:
+        return operation(**build_request(message, session_id))
+    except Exception as e:
+        if not session_id or not is_invalid_session_error(e):
+            raise
+        logger.info(f"Bedrock session {session_id} is no longer valid, starting a new one")
+        return operation(**build_request(message))
+
+
+def retrieve_passages(message):
+    # Top KB_RETRIEVE_RESULTS passages for the question, best score first
+    response = get_bedrock_agent_runtime().retrieve(
+        knowledgeBaseId=KNOWLEDGE_BASE_ID,
+        retrievalQuery={'text': message},
+        retrievalConfiguration={'vectorSearchConfiguration': {'numberOfResults': KB_RETRIEVE_RESULTS}}
+    )
+    passages = [{'text': result['content']['text'], 'score': result.get('score', 0.0)}
+                for result in response.get('retrievalResults', []) if result.get('content', {}).get('text')]
+    return sorted(passages, key=lambda passage: passage['score'], reverse=True)
+
+
+def generate_from_passages(message, passages):
+    # Answer with the smaller model, grounded only in the retrieved passages
+    context = '\n\n'.join(f"<passage>\n{passage['text']}\n</passage>" for passage in passages)
+    response = get_bedrock_runtime().converse(
+        modelId=KB_FAST_MODEL_ID,
+        system=[{'text': "Answer the user's question using only the passages below. If they do not contain "
+                         f"the answer, reply with exactly {NO_ANSWER}.\n\n{context}"}],
+        messages=[{'role': 'user', 'content': [{'text': message}]}],
+        inferenceConfig={'maxTokens': 1024, 'temperature': 0}
+    )
+    return ''.join(block.get('text', '') for block in response['output']['message']['content']).strip()
+
+
+def fast_path_answer(message):
+    # Answer from the retrieved passages when retrieval is confident, None means use retrieve_and_generate
+    try:
+        passages = retrieve_passages(message)
+        if not passages or passages[0]['score'] < KB_FAST_PATH_MIN_SCORE:
+            logger.info(f"Fast path skipped (best score {passages[0]['score'] if passages else None})")
+            return None
+        if KB_FAST_PATH_MODE == 'passage':
+            return passages[0]['text']
+        confident = [passage for passage in passages if passage['score'] >= KB_FAST_PATH_MIN_SCORE]
+        answer = generate_from_passages(message, confident)
+        if not answer or NO_ANSWER in answer:
+            logger.info("Fast path model found no answer in the passages")
+            return None
+        return answer
+    except Exception as e:
+        logger.error(f"Fast path failed, falling back to retrieve_and_generate: {e}")
+        return None
+
+
+def query_knowledge_base(message):
+    return query_knowledge_base_session(message)[0]
+
+
+def query_knowledge_base_session(message, session_id=None, follow_up=False):
+    """Answer message, continuing the Bedrock session session_id when given.
 
-    response = bedrock_agent_runtime.retrieve_and_generate(**request_body)
+    Returns (answer, session id for the next turn or None). Follow-ups (a session_id,
+    or follow_up=True for a thread answered without a session) skip the answer cache
+    and the fast path: their answer depends on the earlier turns, and
+    retrieve_and_generate creates the session the next turns continue.
+    """
+    follow_up = follow_up or session_id is not None
+    if not follow_up:
+        cached_answer = get_cached_answer(message)
+        if cached_answer is not None:
+            return cached_answer, None
+
+        if KB_FAST_PATH:
+            fast_answer = fast_path_answer(message)
+            if fast_answer is not None:
+                if KB_CACHE_ENABLED:
+                    answer_cache.put(message, fast_answer)
+                return fast_answer, None
+
+    bedrock_agent_runtime = get_bedrock_agent_runtime()
+
+    response = call_in_session(bedrock_agent_runtime.retrieve_and_generate, message, session_id)
 
     generated_text = response['output']['text']
-    return generated_text
+
+    if KB_CACHE_ENABLED and not follow_up:
+        answer_cache.put(message, generated_text)
+    return generated_text, response.get('sessionId')
+
+
+def query_knowledge_base_stream(message, session_id=None, on_session=None, follow_up=False):
+    # Same as query_knowledge_base_session, but yields the answer in chunks as Bedrock generates it.
+    # on_session(session_id) is called with the session to use for the next turn
+    follow_up = follow_up or session_id is not None
+    if not follow_up:
+        cached_answer = get_cached_answer(message)
+        if cached_answer is not None:
+            yield cached_answer
+            return
+
+        if KB_FAST_PATH:
+            fast_answer = fast_path_answer(message)
+            if fast_answer is not None:
+                if KB_CACHE_ENABLED:
+                    answer_cache.put(message, fast_answer)
+                yield fast_answer
+                return
+
+    bedrock_agent_runtime = get_bedrock_agent_runtime()
+
+    response = call_in_session(bedrock_agent_runtime.retrieve_and_generate_stream, message, session_id)
+    if on_session is not None and response.get('sessionId'):
+        on_session(response['sessionId'])
+
+    chunks = []
+    for event in response['stream']:
+        # Citation and guardrail events carry no answer text
+        text = event.get('output', {}).get('text')
+        if text:
+            chunks.append(text)
+            yield text
+
+    if KB_CACHE_ENABLED and not follow_up:
+        answer_cache.put(message, ''.join(chunks))
+
+
+def read_questions(path, question_field=None, id_field=None):
+    # Yield (id, question) from a CSV (e.g. slack_messages.csv) or JSONL file, skipping empty questions.
+    # The id is id_field when given and present, otherwise the row number
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        for index, row in enumerate(rows):
+            field = question_field or ('question' if 'question' in row else 'text')
+            question = (row.get(field) or '').strip()
+            if question:
+                question_id = row.get(id_field) if id_field else None
+                yield str(question_id) if question_id else f"row-{index}", question
+
+
+def load_answered_ids(output_path):
+    # Ids already answered in an earlier run of the same output file; failed questions are retried
+    answered = set()
+    if not os.path.exists(output_path):
+        return answered
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Last line of an interrupted run
+            if record.get('error') is None:
+                answered.add(record['id'])
+    return answered
+
+
+def is_throttling_error(error):
+    from botocore.exceptions import ClientError
+    return isinstance(error, ClientError) and error.response['Error']['Code'] == 'ThrottlingException'
+
+
+def answer_question(question, limiter, max_retries):
+    # Query the KB through the shared rate limiter, slowing it down on every ThrottlingException
+    attempt = 0
+    while True:
+        limiter.acquire()
+        try:
+            answer = query_knowledge_base(question)
+            limiter.on_success()
+            return answer, attempt + 1
+        except Exception as e:
+            if not is_throttling_error(e) or attempt >= max_retries:
+                raise
+            limiter.on_rate_limited(min(2 ** attempt, 30))
+            attempt += 1
+
+
+def run_batch(input_path, output_path, concurrency=8, max_rate=5.0, max_retries=5, question_field=None,
+              id_field=None):
+    """Answer every question of input_path and append one JSON line per question to output_path.
+
+    Questions run on a bounded pool behind an AIMD rate limiter that halves on
+    Bedrock throttling. Each answer is written (with its latency) as soon as it
+    completes, so rerunning the same command resumes an interrupted run.
+    """
+    answered = load_answered_ids(output_path)
+    questions = [(question_id, question) for question_id, question in read_questions(input_path, question_field,
+                                                                                      id_field)
+                 if question_id not in answered]
+    print(f"{len(questions)} questions to answer ({len(answered)} already answered in {output_path})")
+    if not questions:
+        return True
+
+    warm_up()
+    limiter = AdaptiveTokenBucket('bedrock', max_rate, capacity=concurrency)
+    latencies = []
+    failed = 0
+
+    def answer(question_id, question):
+        started = time.perf_counter()
+        record = {'id': question_id, 'question': question, 'answer': None, 'error': None}
+        try:
+            record['answer'], record['attempts'] = answer_question(question, limiter, max_retries)
+        except Exception as e:
+            record['error'] = f"{type(e).__name__}: {e}"
+        record['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        return record
+
+    with open(output_path, 'a', encoding='utf-8') as output, \
+            ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(answer, question_id, question) for question_id, question in questions]
+        for done, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            output.write(json.dumps(record, ensure_ascii=False) + '\n')
+            output.flush()
+            if record['error']:
+                failed += 1
+                logger.error(f"Question {record['id']} failed: {record['error']}")
+            else:
+                latencies.append(record['latency_ms'])
+            if done % 25 == 0 or done == len(futures):
+                print(f"{done}/{len(futures)} answered, {failed} failed, rate {limiter.rate():.2f}/s")
+
+    if latencies:
+        latencies.sort()
+        print(f"Latency p50 {latencies[len(latencies) // 2]} ms, "
+              f"p95 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]} ms")
+    return failed == 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Query the Bedrock knowledge base interactively or in batch")
+    parser.add_argument('--batch', metavar='INPUT', help="Answer the questions of a CSV or JSONL file")
+    parser.add_argument('--output', help="JSONL output of the batch (default: <INPUT>.answers.jsonl)")
+    parser.add_argument('--question-field', help="Column or key holding the question (default: question, then text)")
+    parser.add_argument('--id-field', default='timestamp',
+                        help="Column or key identifying a question for resume (default: timestamp, else row number)")
+    parser.add_argument('--concurrency', type=int, default=8, help="Questions in flight (default: 8)")
+    parser.add_argument('--max-rate', type=float, default=5.0, help="Highest request rate per second (default: 5)")
+    parser.add_argument('--max-retries', type=int, default=5, help="Retries of a throttled question (default: 5)")
+    parser.add_argument('--use-cache', action='store_true', help="Let the batch use the answer cache")
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
+    if args.batch:
+        global KB_CACHE_ENABLED
+        KB_CACHE_ENABLED = args.use_cache  # An evaluation wants fresh answers by default
+        output_path = args.output or os.path.splitext(args.batch)[0] + '.answers.jsonl'
+        ok = run_batch(args.batch, output_path, args.concurrency, args.max_rate, args.max_retries,
+                       args.question_field, args.id_field)
+        sys.exit(0 if ok else 1)
+
     print("Welcome to the AWS Bedrock Knowledge Base Query Tool")
     print("Type 'quit' to exit the program")
 
+    # Create the Bedrock client before the first question
+    warm_up()
+
     while True:
         # Get input from the user
         user_input = input("\nEnter your question: ").strip()
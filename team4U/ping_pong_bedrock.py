@@ -1,35 +1,216 @@
-import boto3
 import json
-from botocore.exceptions import ClientError
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 
 import os
-from dotenv import load_dotenv
 
-# טען את משתני הסביבה מקובץ .env
-load_dotenv(dotenv_path='.env')
-# השתמש במשתנים
+# Error codes that mean the request was throttled (the stream reports them in camelCase)
+THROTTLING_ERRORS = {'throttlingexception', 'toomanyrequestsexception', 'servicequotaexceededexception'}
 
+# Inference profile prefix of each region, substituted for {geo} in model ids
+GEO_PREFIXES = {'eu': 'eu', 'us': 'us', 'ap': 'apac'}
+
+FILLER = ("The quarterly support report lists the open incidents, their owners, the services they affect "
+          "and the steps taken so far to restore them. ")
 
-def main():
-    client = boto3.client("bedrock-runtime",
 
+def get_client(region, max_pool_connections=10, max_attempts=4):
+    import boto3
+    from botocore.config import Config
+    return boto3.client("bedrock-runtime",
                         aws_access_key_id=os.getenv('aws_access_key_id'),
                         aws_secret_access_key=os.getenv('aws_secret_access_key'),
-                          region_name="eu-west-1",
-                          )
+                        region_name=region,
+                        config=Config(max_pool_connections=max_pool_connections, tcp_keepalive=True,
+                                      retries={'max_attempts': max_attempts, 'mode': 'standard'}))
+
+
+def build_payload(user_message, max_tokens):
+    return json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": max_tokens,
+        "messages": [
+            {"role": "user", "content": user_message}
+        ],
+        "temperature": 0.5
+    })
+
+
+def build_prompt(question, prompt_words):
+    # Pad the question with filler text to about prompt_words words
+    if not prompt_words:
+        return question
+    words = (FILLER * (prompt_words // len(FILLER.split()) + 1)).split()[:prompt_words]
+    return ' '.join(words) + "\n\n" + question
+
+
+def resolve_model_id(model_id, region):
+    # "{geo}.anthropic.claude-..." becomes "eu.anthropic.claude-..." in eu-west-1
+    return model_id.replace('{geo}', GEO_PREFIXES.get(region.split('-')[0], region.split('-')[0]))
+
+
+def invoke_streaming(client, model_id, payload):
+    # One streamed call. Returns a dict with the timings (seconds) and token counts,
+    # 'error' holds the error code of a failed call, or the exception name of a client side
+    # failure (e.g. ReadTimeoutError, EndpointConnectionError: retries are off while probing)
+    from botocore.exceptions import BotoCoreError, ClientError
+    started = time.perf_counter()
+    result = {'ttfb': None, 'latency': None, 'input_tokens': None, 'output_tokens': None, 'error': None}
+    try:
+        response = client.invoke_model_with_response_stream(modelId=model_id, contentType="application/json",
+                                                            body=payload)
+        for event in response['body']:
+            chunk = json.loads(event['chunk']['bytes'])
+            if chunk['type'] == 'content_block_delta' and result['ttfb'] is None:
+                result['ttfb'] = time.perf_counter() - started
+            elif chunk['type'] == 'message_start':
+                result['input_tokens'] = chunk['message']['usage'].get('input_tokens')
+            elif chunk['type'] == 'message_delta':
+                result['output_tokens'] = chunk.get('usage', {}).get('output_tokens')
+        result['latency'] = time.perf_counter() - started
+    except ClientError as e:
+        result['error'] = e.response['Error']['Code']
+    except BotoCoreError as e:
+        result['error'] = type(e).__name__
+    return result
+
+
+def percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def rank(p):
+        return round(ordered[min(len(ordered) - 1, max(0, int(len(ordered) * p / 100 + 0.5) - 1))] * 1000, 1)
+
+    return {'p50': rank(50), 'p95': rank(95), 'p99': rank(99), 'max': round(ordered[-1] * 1000, 1)}
+
+
+def probe(region, model_id, args):
+    # Send args.requests calls with args.concurrency in flight and summarise them
+    client = get_client(region, max_pool_connections=args.concurrency, max_attempts=1)  # No retries: count throttles
+    payload = build_payload(build_prompt(args.question, args.prompt_words), args.max_tokens)
+
+    # Untimed calls first, so connection setup and credential resolution are not measured
+    for _ in range(args.warmup):
+        invoke_streaming(client, model_id, payload)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(lambda _: invoke_streaming(client, model_id, payload), range(args.requests)))
+    wall = time.perf_counter() - started
+
+    succeeded = [result for result in results if result['error'] is None]
+    throttled = 0
+    errors = {}
+    for result in results:
+        if result['error'] is None:
+            continue
+        if result['error'].lower() in THROTTLING_ERRORS:
+            throttled += 1
+        else:
+            errors[result['error']] = errors.get(result['error'], 0) + 1
+
+    # Generation speed: output tokens over the time after the first token
+    tokens_per_second = [result['output_tokens'] / (result['latency'] - result['ttfb']) for result in succeeded
+                         if result['output_tokens'] and result['ttfb'] and result['latency'] > result['ttfb']]
+    output_tokens = sum(result['output_tokens'] or 0 for result in succeeded)
+    return {
+        'region': region,
+        'model_id': model_id,
+        'requests': len(results),
+        'succeeded': len(succeeded),
+        'throttled': throttled,
+        'throttle_rate': round(throttled / len(results), 4) if results else 0.0,
+        'errors': errors,
+        'ttfb_ms': percentiles([result['ttfb'] for result in succeeded if result['ttfb'] is not None]),
+        'latency_ms': percentiles([result['latency'] for result in succeeded]),
+        'output_tokens_per_second': {
+            'p50': round(sorted(tokens_per_second)[len(tokens_per_second) // 2], 1),
+            'mean': round(sum(tokens_per_second) / len(tokens_per_second), 1),
+        } if tokens_per_second else None,
+        'aggregate_output_tokens_per_second': round(output_tokens / wall, 1) if wall else None,
+        'requests_per_second': round(len(succeeded) / wall, 2) if wall else None,
+        'mean_input_tokens': round(sum(result['input_tokens'] or 0 for result in succeeded) / len(succeeded), 1)
+        if succeeded else None,
+        'wall_seconds': round(wall, 3),
+    }
+
+
+def run_probe(args):
+    report = {
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'probe')},
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': [],
+    }
+
+    # Combinations are probed one after the other, so they do not compete for the local network and CPU
+    for region in args.regions:
+        for model in args.models:
+            model_id = resolve_model_id(model, region)
+            print(f"Probing {model_id} in {region}: {args.requests} requests, concurrency {args.concurrency}")
+            try:
+                report['results'].append(probe(region, model_id, args))
+            except Exception as e:
+                report['results'].append({'region': region, 'model_id': model_id, 'error': str(e)})
+
+    ranked = [result for result in report['results'] if result.get('latency_ms')]
+    ranked.sort(key=lambda result: (result['throttle_rate'], result['latency_ms']['p50']))
+    for result in ranked:
+        print(f"{result['region']:<12} {result['model_id']:<50} "
+              f"TTFB p50 {result['ttfb_ms']['p50'] if result['ttfb_ms'] else '-'} ms, "
+              f"latency p50/p95/p99 {result['latency_ms']['p50']}/{result['latency_ms']['p95']}/"
+              f"{result['latency_ms']['p99']} ms, throttled {result['throttle_rate']:.1%}")
+    if ranked:
+        report['fastest'] = {'region': ranked[0]['region'], 'model_id': ranked[0]['model_id']}
+        print(f"Fastest: {ranked[0]['model_id']} in {ranked[0]['region']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ping a Bedrock model, or probe latency and throughput with --probe")
+    parser.add_argument('--probe', action='store_true', help="Run the latency/throughput probe instead of one ping")
+    parser.add_argument('--regions', default='eu-west-1,us-east-1',
+                        type=lambda value: [item.strip() for item in value.split(',') if item.strip()],
+                        help="Comma separated regions to compare (default: eu-west-1,us-east-1)")
+    parser.add_argument('--models', default='{geo}.anthropic.claude-3-5-sonnet-20240620-v1:0',
+                        type=lambda value: [item.strip() for item in value.split(',') if item.strip()],
+                        help="Comma separated model ids, {geo} is replaced by the region's inference profile prefix")
+    parser.add_argument('--requests', type=int, default=20, help="Timed requests per region and model (default: 20)")
+    parser.add_argument('--concurrency', type=int, default=4, help="Requests in flight (default: 4)")
+    parser.add_argument('--warmup', type=int, default=1, help="Untimed requests sent first (default: 1)")
+    parser.add_argument('--prompt-words', type=int, default=0, help="Pad the prompt to about this many words")
+    parser.add_argument('--max-tokens', type=int, default=70, help="max_tokens of each request (default: 70)")
+    parser.add_argument('--question', default="who is lebron james?", help="Question sent to the model")
+    parser.add_argument('--output', help="Write the probe results as JSON to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # טען את משתני הסביבה מקובץ .env
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path='.env')
+
+    if args.probe:
+        run_probe(args)
+        return
+
+    client = get_client("eu-west-1")
     model_id = "eu.anthropic.claude-3-5-sonnet-20240620-v1:0"
     system_prompt = "You are a helpful assistant."
-    user_message = "who is lebron james?"
+    user_message = args.question
 
+    from botocore.exceptions import ClientError
     try:
-        prompt_payload = json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 70,
-            "messages": [
-                {"role": "user", "content": user_message}
-            ],
-            "temperature": 0.5
-        })
+        prompt_payload = build_payload(build_prompt(user_message, args.prompt_words), args.max_tokens)
 
         response = client.invoke_model(
             modelId=model_id,
@@ -0,0 +1,112 @@
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# S3 requires every part except the last to be at least 5 MiB
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class S3MultipartWriter(io.RawIOBase):
+    """Binary file object that streams what is written to it into an S3 object.
+
+    Data is cut into fixed-size parts uploaded in the background with S3
+    multipart upload, so memory stays around (max_concurrency + 1) * part_size
+    whatever the object size. Objects smaller than one part are sent with a
+    single put_object.
+
+    complete() publishes the object. close() without complete() discards the
+    upload, so a crash halfway through never leaves a truncated export behind.
+    """
+
+    def __init__(self, s3, bucket, key, part_size=8 * 1024 * 1024, max_concurrency=4):
+        super().__init__()
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.bytes_written = 0
+        self.completed = False
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._futures = []
+        self._executor = None
+        # Bounds the number of parts held in memory while they upload
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._max_concurrency = max_concurrency
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.bytes_written
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        # Only the "where am I" query is supported (used by BufferedWriter.tell and Parquet writers)
+        if offset == 0 and whence == io.SEEK_CUR:
+            return self.bytes_written
+        raise io.UnsupportedOperation("S3MultipartWriter is not seekable")
+
+    def write(self, b):
+        if self.closed:
+            raise ValueError("write to closed S3MultipartWriter")
+        self._buffer += b
+        self.bytes_written += len(b)
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._submit_part(part)
+        return len(b)
+
+    def _submit_part(self, body):
+        if self._upload_id is None:
+            response = self.s3.create_multipart_upload(Bucket=self.bucket, Key=self.key)
+            self._upload_id = response['UploadId']
+            self._executor = ThreadPoolExecutor(max_workers=self._max_concurrency, thread_name_prefix='s3-part')
+        part_number = len(self._futures) + 1
+        self._slots.acquire()  # Back-pressure: wait while max_concurrency parts are in flight
+        self._futures.append(self._executor.submit(self._upload_part, part_number, body))
+
+    def _upload_part(self, part_number, body):
+        try:
+            response = self.s3.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                           PartNumber=part_number, Body=body)
+            return {'PartNumber': part_number, 'ETag': response['ETag']}
+        finally:
+            self._slots.release()
+
+    def complete(self):
+        # Upload what is left and publish the object
+        if self.closed:
+            raise ValueError("complete on closed S3MultipartWriter")
+        if self._upload_id is None:
+            # Small object: a single request is cheaper than a multipart upload
+            self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer))
+        else:
+            if self._buffer:
+                self._submit_part(bytes(self._buffer))
+            parts = [future.result() for future in self._futures]
+            self.s3.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                              MultipartUpload={'Parts': parts})
+        self._buffer.clear()
+        self.completed = True
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if not self.completed and self._upload_id is not None:
+                for future in self._futures:
+                    future.cancel()
+                self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+            super().close()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None and not self.closed:
+            self.complete()
+        else:
+            self.close()
+
@@ -0,0 +1,73 @@
+import os
+import threading
+
+from slack_rate_limit import get_limiter
+
+SLACK_API_BASE_URL = os.getenv('SLACK_API_BASE_URL', 'https://slack.com/api/')
+# Keep at least as many pooled connections as threads calling Slack in parallel (CHANNEL_WORKERS x REPLY_FETCH_WORKERS)
+SLACK_HTTP_POOL_SIZE = int(os.getenv('SLACK_HTTP_POOL_SIZE', '32'))
+SLACK_HTTP_RETRIES = int(os.getenv('SLACK_HTTP_RETRIES', '3'))
+SLACK_HTTP_TIMEOUT = float(os.getenv('SLACK_HTTP_TIMEOUT', '30'))
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class SlackApiError(Exception):
+    def __init__(self, method, error, status_code=200):
+        super().__init__(f"{method} failed: {error} (status {status_code})")
+        self.method = method
+        self.error = error
+        self.status_code = status_code
+
+
+def get_slack_session():
+    # One keep-alive session per process, so TLS to slack.com is negotiated once
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                # Imported on first use, importing this module does not pay for requests
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                # Connection errors and 5xx are retried here with backoff (honouring Retry-After on 503).
+                # 429 is left to the callers, which slow down the shared rate limiter for every worker.
+                retry = Retry(
+                    total=SLACK_HTTP_RETRIES,
+                    backoff_factor=0.5,
+                    status_forcelist=(500, 502, 503, 504),
+                    allowed_methods=frozenset(['GET', 'POST']),
+                    respect_retry_after_header=True,
+                    raise_on_status=False
+                )
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=SLACK_HTTP_POOL_SIZE, max_retries=retry)
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def slack_api_get(method, token, **params):
+    # Call a Slack Web API method through the shared session and rate limiter, return the JSON body
+    params = {key: value for key, value in params.items() if value is not None}
+    headers = {'Authorization': f'Bearer {token}'}
+    limiter = get_limiter(method)
+    while True:
+        limiter.acquire()
+        response = get_slack_session().get(SLACK_API_BASE_URL + method, params=params, headers=headers,
+                                           timeout=SLACK_HTTP_TIMEOUT)
+        if response.status_code == 429:
+            retry_after = int(response.headers.get('Retry-After', 1))
+            print(f"Rate limit hit. Pausing all requests for {retry_after} seconds.")
+            limiter.on_rate_limited(retry_after)
+            continue
+        if response.status_code != 200:
+            raise SlackApiError(method, response.text, response.status_code)
+        limiter.on_success()
+        data = response.json()
+        if not data.get('ok'):
+            raise SlackApiError(method, data.get('error'))
+        return data
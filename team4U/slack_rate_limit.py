@@ -0,0 +1,226 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Documented Slack Web API limits per tier, in calls per minute per method and workspace
+# (https://api.slack.com/apis/rate-limits). Override a tier with SLACK_TIER<n>_PER_MINUTE.
+SLACK_TIER_PER_MINUTE = {
+    tier: float(os.getenv(f'SLACK_TIER{tier}_PER_MINUTE', default))
+    for tier, default in {1: 1, 2: 20, 3: 50, 4: 100}.items()
+}
+# chat.postMessage is "special": about one message per second per channel, under a workspace-wide
+# cap of several hundred messages per minute
+SLACK_POST_PER_MINUTE = float(os.getenv('SLACK_POST_PER_MINUTE', '60'))
+SLACK_POST_WORKSPACE_PER_MINUTE = float(os.getenv('SLACK_POST_WORKSPACE_PER_MINUTE', '300'))
+
+# Methods limited per channel: (calls per minute per channel, calls per minute per workspace)
+SLACK_PER_CHANNEL_METHODS = {
+    'chat.postMessage': (SLACK_POST_PER_MINUTE, SLACK_POST_WORKSPACE_PER_MINUTE),
+}
+
+SLACK_METHOD_TIERS = {
+    'auth.test': 4,
+    'conversations.history': 3,
+    'conversations.replies': 3,
+    'conversations.info': 3,
+    'conversations.list': 2,
+    'chat.update': 3,
+}
+DEFAULT_TIER = 3
+
+# Burst size of every bucket, and how far above the documented rate AIMD may probe
+SLACK_RATE_LIMIT_BURST = int(os.getenv('SLACK_RATE_LIMIT_BURST', '5'))
+SLACK_RATE_LIMIT_HEADROOM = float(os.getenv('SLACK_RATE_LIMIT_HEADROOM', '1.2'))
+# SQLite file shared by every process on the host; unset keeps the limiter per process
+SLACK_RATE_LIMIT_DB = os.getenv('SLACK_RATE_LIMIT_DB')
+
+
+class MemoryStateStore:
+    # Bucket state kept in this process
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def transact(self, key, initial, update):
+        # Run update(state) atomically on the state of key and return its result
+        with self._lock:
+            state = self._states.setdefault(key, dict(initial))
+            return update(state)
+
+
+class SQLiteStateStore:
+    # Bucket state shared through a SQLite file, so every process on the host draws from the same budget
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute("CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, state TEXT NOT NULL)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def transact(self, key, initial, update):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")  # Takes the write lock, serialising all processes
+        try:
+            row = conn.execute("SELECT state FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            state = json.loads(row[0]) if row else dict(initial)
+            result = update(state)
+            conn.execute("INSERT OR REPLACE INTO rate_limits (key, state) VALUES (?, ?)", (key, json.dumps(state)))
+            conn.execute("COMMIT")
+            return result
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class AdaptiveTokenBucket:
+    """Token bucket whose rate adapts with AIMD to the 429s Slack returns.
+
+    Every success adds a small step to the rate (up to ceiling); a 429 halves
+    it (down to floor) and pauses every caller for Retry-After seconds. The
+    state lives in a store, so one bucket can be shared by threads or processes.
+    """
+
+    def __init__(self, key, rate, ceiling=None, floor=None, capacity=SLACK_RATE_LIMIT_BURST, store=None,
+                 clock=time.time, sleep=time.sleep):
+        self.key = key
+        self.ceiling = ceiling or rate
+        self.floor = floor or rate / 10
+        self.increase = self.ceiling / 100  # Additive step per success
+        self.capacity = capacity
+        self._store = store or MemoryStateStore()
+        self._clock = clock
+        self._sleep = sleep
+        self._initial = {'rate': rate, 'tokens': capacity, 'updated': clock(), 'paused_until': 0}
+
+    def _take(self, state):
+        # Take a token if possible, otherwise return how long to wait
+        now = self._clock()
+        if now < state['paused_until']:
+            return state['paused_until'] - now
+        state['tokens'] = min(self.capacity, state['tokens'] + (now - state['updated']) * state['rate'])
+        state['updated'] = now
+        if state['tokens'] >= 1:
+            state['tokens'] -= 1
+            return 0
+        return (1 - state['tokens']) / state['rate']
+
+    def acquire(self):
+        # Block until a token is available and no Retry-After pause is active
+        while True:
+            wait = self._store.transact(self.key, self._initial, self._take)
+            if wait <= 0:
+                return
+            self._sleep(wait)
+
+    async def acquire_async(self):
+        # acquire() for asyncio callers, waits without blocking the event loop. The state is
+        # read on a worker thread: with the SQLite store a transaction may wait on the file lock
+        import asyncio  # Only the async bot needs it, the exporters skip its import cost
+        while True:
+            wait = await asyncio.to_thread(self._store.transact, self.key, self._initial, self._take)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def try_acquire(self):
+        # Take a token without waiting, return False if none is available
+        return self._store.transact(self.key, self._initial, self._take) <= 0
+
+    def on_success(self):
+        def increase(state):
+            state['rate'] = min(self.ceiling, state['rate'] + self.increase)
+        self._store.transact(self.key, self._initial, increase)
+
+    def on_rate_limited(self, retry_after):
+        # Halve the rate and stop every caller for retry_after seconds
+        def decrease(state):
+            now = self._clock()
+            state['rate'] = max(self.floor, state['rate'] / 2)
+            state['paused_until'] = max(state['paused_until'], now + retry_after)
+            state['tokens'] = 0
+            state['updated'] = now
+        self._store.transact(self.key, self._initial, decrease)
+
+    def rate(self):
+        return self._store.transact(self.key, self._initial, lambda state: state['rate'])
+
+
+class ChannelLimiter:
+    """Limiter of a per-channel method: the channel's bucket, then the workspace-wide one.
+
+    A 429 slows down and pauses the channel it was returned for, the other
+    channels keep posting.
+    """
+
+    def __init__(self, channel_bucket, workspace_bucket):
+        self.channel_bucket = channel_bucket
+        self.workspace_bucket = workspace_bucket
+
+    def acquire(self):
+        self.channel_bucket.acquire()
+        self.workspace_bucket.acquire()
+
+    async def acquire_async(self):
+        await self.channel_bucket.acquire_async()
+        await self.workspace_bucket.acquire_async()
+
+    def try_acquire(self):
+        return self.channel_bucket.try_acquire() and self.workspace_bucket.try_acquire()
+
+    def on_success(self):
+        self.channel_bucket.on_success()
+        self.workspace_bucket.on_success()
+
+    def on_rate_limited(self, retry_after):
+        self.channel_bucket.on_rate_limited(retry_after)
+
+    def rate(self):
+        return min(self.channel_bucket.rate(), self.workspace_bucket.rate())
+
+
+_store = None
+_limiters = {}
+_channel_limiters = {}  # One per channel the bot has posted to
+_limiters_lock = threading.Lock()
+
+
+def _get_bucket(key, per_minute):
+    # Bucket shared under key, the caller holds _limiters_lock
+    global _store
+    bucket = _limiters.get(key)
+    if bucket is None:
+        if _store is None:
+            _store = SQLiteStateStore(SLACK_RATE_LIMIT_DB) if SLACK_RATE_LIMIT_DB else MemoryStateStore()
+        rate = per_minute / 60
+        bucket = AdaptiveTokenBucket(key, rate, ceiling=rate * SLACK_RATE_LIMIT_HEADROOM, store=_store)
+        _limiters[key] = bucket
+    return bucket
+
+
+def get_limiter(method, channel=None):
+    # Shared limiter for a Slack Web API method (e.g. 'conversations.replies'). Methods limited per
+    # channel (chat.postMessage) get a bucket per channel under the workspace-wide one; without a
+    # channel only the workspace-wide bucket is returned
+    with _limiters_lock:
+        if method not in SLACK_PER_CHANNEL_METHODS:
+            return _get_bucket(method, SLACK_TIER_PER_MINUTE[SLACK_METHOD_TIERS.get(method, DEFAULT_TIER)])
+
+        per_channel, per_workspace = SLACK_PER_CHANNEL_METHODS[method]
+        workspace_bucket = _get_bucket(method, per_workspace)
+        if not channel:
+            return workspace_bucket
+        limiter = _channel_limiters.get((method, channel))
+        if limiter is None:
+            limiter = ChannelLimiter(_get_bucket(f"{method}:{channel}", per_channel), workspace_bucket)
+            _channel_limiters[(method, channel)] = limiter
+        return limiter
@@ -1,40 +1,107 @@
 import os
 import logging
+
 from flask import Flask, request, jsonify
 from slack_bolt import App
 from slack_bolt.adapter.flask import SlackRequestHandler
-from model_according_to_KB import query_knowledge_base as qkb
-from dotenv import load_dotenv
-from datetime import datetime
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+from worker_pool import BoundedWorkerPool
+from dedup_store import make_dedup_store
+from bot_messages import ERROR_MESSAGE
+from bot_core import BotState, THINKING_MESSAGE, escalation_text, is_escalation, mention_question, retry_after, \
+    thread_key
+
+# Flask entry point of the bot. Importing it has no side effects (no .env loading, no Slack call);
+# create_app() loads the settings and builds the app:
+#   gunicorn 'slackbot:create_app()' --bind 0.0.0.0:3000
+#   python slackbot.py
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
-
-
-# Create a Slack app instance
-slack_app = App(
-    token=os.environ.get("SLACK_BOT_TOKEN"),
-    signing_secret=os.environ.get("SLACK_SIGNING_SECRET")
-)
-
-# Create a Flask app
-app = Flask(__name__)
-
-# Initialize the SlackRequestHandler
-handler = SlackRequestHandler(slack_app)
+# Set by create_app()
+slack_app = None  # Bolt app, its client sends the replies
+handler = None  # SlackRequestHandler of slack_app
+processed_events = None  # Dedup store of the event ids already handled
+worker_pool = None  # Background workers that answer questions after Slack has been acked
+state = None  # Thread root and Bedrock session caches and the answer settings, shared logic with slackbot_async.py
+
+
+def create_app():
+    # Load .env and build the Slack and Flask apps; returns the Flask (WSGI) app
+    global slack_app, handler, processed_events, worker_pool, state
+    from dotenv import load_dotenv
+    load_dotenv()  # Before anything reads its settings from the environment
+
+    # Listeners only validate the event and hand the slow work (Bedrock query, Slack replies)
+    # to worker_pool, so they can run before the response without delaying the ack.
+    # Building the App calls auth.test to check the token
+    slack_app = App(
+        client=WebClient(token=os.environ.get("SLACK_BOT_TOKEN"),
+                         base_url=os.environ.get("SLACK_API_BASE_URL", "https://slack.com/api/")),
+        signing_secret=os.environ.get("SLACK_SIGNING_SECRET"),
+        process_before_response=True
+    )
+    slack_app.event("message")(handle_message)
+    slack_app.event("app_mention")(handle_mention)
+    handler = SlackRequestHandler(slack_app)
+
+    # Store processed events to prevent duplicate processing.
+    # Bounded and time-expiring; DEDUP_BACKEND=sqlite|redis shares it between workers
+    processed_events = make_dedup_store()
+
+    # When all workers are busy and the queue is full, new events are dropped (load shedding)
+    worker_pool = BoundedWorkerPool(int(os.environ.get("WORKER_CONCURRENCY", "8")),
+                                    int(os.environ.get("WORKER_QUEUE_DEPTH", "32")), name="kb-worker")
+
+    state = BotState.from_env()
+
+    app = Flask(__name__)
+    app.add_url_rule("/slack/events", view_func=slack_events, methods=["POST"])
+    app.add_url_rule("/", view_func=health_check, methods=["GET"])
+    app.register_error_handler(Exception, handle_error)
+
+    # Create the shared Bedrock client before the first event arrives, in every gunicorn worker
+    from model_according_to_KB import warm_up
+    warm_up()
+    return app
+
+
+def slack_call(method, **kwargs):
+    # Call a Slack Web API method (e.g. 'chat.postMessage') through the rate limiter shared
+    # with the exporters (per channel for chat.postMessage), waiting out 429s instead of failing
+    from slack_rate_limit import get_limiter  # Reads its settings at import, after create_app() loaded .env
+    limiter = get_limiter(method, kwargs.get('channel'))
+    client_method = getattr(slack_app.client, method.replace('.', '_'))
+    while True:
+        limiter.acquire()
+        try:
+            response = client_method(**kwargs)
+            limiter.on_success()
+            return response
+        except SlackApiError as e:
+            wait = retry_after(e)
+            if wait is None:
+                raise
+            logger.warning(f"{method} rate limited, retrying in {wait} seconds.")
+            limiter.on_rate_limited(wait)
+
+
+def dispatch(task, *args):
+    # Hand a task to the worker pool, never blocking the Slack ack
+    if not worker_pool.submit(task, *args):
+        logger.warning(f"Worker pool is full, dropping {task.__name__} (stats: {worker_pool.stats()})")
+        return False
+    return True
 
-# Store processed events to prevent duplicate processing
-processed_events = set()
 
-
-@slack_app.event("message")
 def handle_message(event, say):
     logger.info(f"Handling message: {event}")
     try:
+        state.remember_thread_root(event)
+
         # Check if the message subtype is 'bot_message'
         if event.get('subtype') == 'bot_message':
             print(event)
@@ -45,39 +112,15 @@ def handle_message(event, say):
 
             logger.info(f"Received bot message from user {user_id}: {clean_message}")
 
-            # Process the message
-            response = process_message(clean_message)
-
-            slack_app.client.chat_postMessage(channel=event['channel'], text=response, thread_ts=event['ts'])
+            # Process the message in the background and reply in the thread
+            dispatch(answer_in_thread, *thread_key(event), clean_message)
 
             # Send the response back to Slack
             # say(response)
         else:
             # If it's not a bot message, check if the text is "GURU HELP"
-            message_text = event['text'].strip()
-            Target_channel = os.environ.get("TARGET_CHANNEL_ID")
-            if message_text.upper() == "GURU HELP":
-                # Retrieve the original message
-                original_message = get_original_message(event)
-                target_channel = Target_channel  # Replace with the ID of the target channel
-
-                if original_message:
-                    # Convert timestamp to a readable date and time
-                    timestamp = float(event['ts'])
-                    dt_object = datetime.fromtimestamp(timestamp)
-                    date_str = dt_object.strftime("%Y-%m-%d %H:%M:%S")  # Format as needed
-
-                    # Send the original message with date and time to the target channel
-                    slack_app.client.chat_postMessage(
-                        channel=target_channel,
-                        text=f"Original message (sent on {date_str}): {original_message}"
-                    )
-                else:
-                    # Send error message to the target channel
-                    slack_app.client.chat_postMessage(
-                        channel=target_channel,
-                        text="Unable to retrieve the original message. Please try again."
-                    )
+            if is_escalation(event):
+                dispatch(escalate_to_developers, event)
             else:
                 logger.info("Message is neither 'bot_message' nor 'GURU HELP', ignoring.")
 
@@ -86,20 +129,24 @@ def handle_message(event, say):
         say("An error occurred while processing your request. Please try again or contact support.")
 
 
+def escalate_to_developers(event):
+    # Runs on the worker pool: forward the original question (with its date) to the developers channel
+    original_message = get_original_message(event)
+    slack_call('chat.postMessage', channel=state.target_channel, text=escalation_text(event, original_message))
+
+
 def get_original_message(event):
-    # Implement logic to retrieve the original message here
     try:
-        # Use Slack's conversations.history API to fetch messages in the thread
-        channel_id = event['channel']
-        thread_ts = event.get('thread_ts', event['ts'])  # Use event ts if no thread_ts
+        channel_id, thread_ts = thread_key(event)
 
-        # Fetch thread history to locate the original message
-        result = slack_app.client.conversations_replies(channel=channel_id, ts=thread_ts)
-        messages = result['messages']
+        # The root was usually seen in an earlier event
+        original_message = state.cached_thread_root(channel_id, thread_ts)
+        if original_message is not None:
+            return original_message
 
-        # Assume the first message in the thread is the original question
-        if messages:
-            return messages[0]['text']
+        # Otherwise fetch only the thread root
+        result = slack_call('conversations.replies', channel=channel_id, ts=thread_ts, limit=1)
+        return state.remember_replies_root(channel_id, thread_ts, result['messages'])
     except Exception as e:
         logger.error(f"Error retrieving original message: {str(e)}")
 
@@ -127,28 +174,25 @@ def get_original_message(event):
 #         say("An error occurred while processing your request. Please try again or contact support.")
 
 
-@slack_app.event("app_mention")
 def handle_mention(event, say):
     logger.info(f"Handling app mention: {event}")
     try:
+        state.remember_thread_root(event)
+
         # Use a unique identifier for deduplication
         event_id = event.get("event_ts")  # or "client_msg_id" if available
-        if not event_id or event_id in processed_events:
+        # Mark the mention as processed, add() returns False if it was already seen
+        if not event_id or not processed_events.add(event_id):
             logger.info(f"Duplicate app mention detected: {event_id}. Ignoring.")
             return  # Ignore duplicate mentions
 
-        # Mark the mention as processed
-        processed_events.add(event_id)
-
-        message_text = event['text']
         user_id = event['user']
-        clean_message = message_text.split('>', 1)[-1].strip()
+        clean_message = mention_question(event)
 
         logger.info(f"Received mention from user {user_id}: {clean_message}")
 
-        # Process the message
-        response = process_message(clean_message)
-        slack_app.client.chat_postMessage(channel=event['channel'], text=response, thread_ts=event['ts'])
+        # Process the message in the background and reply in the thread
+        dispatch(answer_in_thread, *thread_key(event), clean_message)
 
         # Send the response back to Slack
 
@@ -159,24 +203,46 @@ def handle_mention(event, say):
         say("An error occurred while processing your request. Please try again or contact support.")
 
 
-def process_message(message):
+def answer_in_thread(channel, thread_ts, message):
+    # Runs on the worker pool: query the knowledge base and reply in the thread (thread_ts is the thread root)
+    if state.streaming_answers:
+        stream_answer_in_thread(channel, thread_ts, message)
+        return
+    response = state.answer(message, channel, thread_ts)
+    slack_call('chat.postMessage', channel=channel, text=response, thread_ts=thread_ts)
+
+
+def stream_answer_in_thread(channel, thread_ts, message):
+    # Post a placeholder right away, then edit it in batches as Bedrock streams the answer
+    placeholder = slack_call('chat.postMessage', channel=channel, text=THINKING_MESSAGE, thread_ts=thread_ts)
+    reply_ts = placeholder['ts']
+
+    from slack_rate_limit import get_limiter
+    reply = state.streamed_reply(get_limiter('chat.update'))
     try:
-        # Add the introductory message
-        intro_message = "Hello I am Guru bot, and the answer I am providing is based on previous responses.\n\n\n"
-        # Query knowledge base and return response
-        response = qkb(message)
-        # Add the summary message
-        response += ("\n\n\nIf the answer is not sufficient and you would like to escalate this to a developer, please"
-                     " reply to your original question with 'GURU HELP'.")
-        # Combine intro, response, and summary message
-        full_response = intro_message + response
-        return full_response
+        for chunk in state.answer_stream(message, channel, thread_ts):
+            text = reply.add(chunk)
+            if text is None:
+                continue
+            try:
+                slack_app.client.chat_update(channel=channel, ts=reply_ts, text=text)
+                reply.edit_sent()
+            except Exception as e:
+                wait = retry_after(e) if isinstance(e, SlackApiError) else None
+                if wait is not None:
+                    reply.edit_rate_limited(wait)
+                else:
+                    # Intermediate edits are best effort, the final edit still sends the whole answer
+                    logger.warning(f"Skipping a chat.update edit that failed: {str(e)}")
+        full_response = reply.final_text()
     except Exception as e:
-        logger.error(f"Error in processing message: {str(e)}")
-        return "An error occurred while processing your request. Please try again or contact support."
+        logger.error(f"Error in streaming message: {str(e)}")
+        full_response = ERROR_MESSAGE
+
+    # Final edit always goes through, waiting out any rate limit pause
+    slack_call('chat.update', channel=channel, ts=reply_ts, text=full_response)
 
 
-@app.route("/slack/events", methods=["POST"])
 def slack_events():
     # Handle events sent from Slack
     data = request.json
@@ -191,28 +257,24 @@ def slack_events():
         if data["type"] == "event_callback":
             event_id = data.get("event_id")
 
-            # Deduplicate based on event_id
-            if event_id in processed_events:
+            # Deduplicate based on event_id and mark the event as processed
+            if event_id and not processed_events.add(event_id):
                 logger.info(f"Duplicate event detected: {event_id}. Ignoring.")
                 return jsonify({"status": "ignored"}), 200
 
-            # Mark event as processed
-            processed_events.add(event_id)
-
     # Let Slack Bolt handle the event
     return handler.handle(request)
 
 
-@app.route("/", methods=["GET"])
 def health_check():
     return "Bot is running!", 200
 
 
-@app.errorhandler(Exception)
 def handle_error(e):
     logger.error(f"An error occurred: {str(e)}")
     return {"status": "error", "message": str(e)}, 500
 
 
 if __name__ == "__main__":
+    app = create_app()
     app.run(host='0.0.0.0', port=3000)  # Run on port 3000
@@ -0,0 +1,253 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.adapter.asgi.async_handler import AsyncSlackRequestHandler
+from slack_bolt.response import BoltResponse
+from slack_sdk.web.async_client import AsyncWebClient
+from slack_sdk.errors import SlackApiError
+from dedup_store import make_dedup_store
+from bot_messages import ERROR_MESSAGE
+from bot_core import BotState, THINKING_MESSAGE, escalation_text, is_escalation, mention_question, retry_after, \
+    thread_key
+
+# ASGI entry point of the bot, an alternative to the Flask app in slackbot.py:
+#   uvicorn slackbot_async:create_app --factory --host 0.0.0.0 --port 3000
+# Each question is a coroutine instead of a worker thread, so one process keeps hundreds in flight.
+# Importing it has no side effects; create_app() loads .env and builds the app.
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Questions being answered at once; beyond ASYNC_MAX_IN_FLIGHT new events are dropped (load shedding)
+ASYNC_MAX_IN_FLIGHT = 500
+in_flight = 0
+
+# Set by create_app()
+slack_app = None  # Async Bolt app, its client sends the replies
+bolt_handler = None  # Bolt serves POST /slack/events (including url_verification)
+processed_events = None  # Dedup store of the event ids already handled
+bedrock_executor = None  # Thread pool of the blocking Bedrock calls
+# Thread root and Bedrock session caches and the answer settings, shared logic with slackbot.py.
+# Its methods only touch in-memory caches, except answer() and the answer_stream() iterator which
+# block on Bedrock and run on bedrock_executor
+state = None
+
+
+def create_app():
+    # Load .env and build the async Slack app; returns the ASGI app
+    global ASYNC_MAX_IN_FLIGHT, slack_app, bolt_handler, processed_events, bedrock_executor, state
+    from dotenv import load_dotenv
+    load_dotenv()  # Before anything reads its settings from the environment
+    from model_according_to_KB import BEDROCK_MAX_POOL_CONNECTIONS, warm_up
+
+    # Events are acked first, then the listeners run as asyncio tasks
+    slack_app = AsyncApp(
+        client=AsyncWebClient(token=os.environ.get("SLACK_BOT_TOKEN"),
+                              base_url=os.environ.get("SLACK_API_BASE_URL", "https://slack.com/api/")),
+        signing_secret=os.environ.get("SLACK_SIGNING_SECRET")
+    )
+    slack_app.middleware(skip_duplicate_events)
+    slack_app.event("message")(handle_message)
+    slack_app.event("app_mention")(handle_mention)
+    bolt_handler = AsyncSlackRequestHandler(slack_app)
+
+    # Store processed events to prevent duplicate processing.
+    # Bounded and time-expiring; DEDUP_BACKEND=sqlite|redis shares it between workers.
+    # Those backends block, so add() (like the SQLite rate limiter) is called on a worker thread
+    processed_events = make_dedup_store()
+
+    ASYNC_MAX_IN_FLIGHT = int(os.environ.get("ASYNC_MAX_IN_FLIGHT", str(ASYNC_MAX_IN_FLIGHT)))
+
+    # The boto3 Bedrock client is blocking, so its calls run on a dedicated thread pool sized like its
+    # connection pool. Questions beyond that wait as cheap coroutines, not as threads
+    bedrock_threads = int(os.environ.get("ASYNC_BEDROCK_THREADS", str(BEDROCK_MAX_POOL_CONNECTIONS)))
+    bedrock_executor = ThreadPoolExecutor(max_workers=bedrock_threads, thread_name_prefix="bedrock")
+
+    state = BotState.from_env()
+
+    # Create the shared Bedrock client before the first event arrives, in every worker process
+    warm_up()
+    return api
+
+
+async def run_blocking(func, *args):
+    # Run a blocking call (Bedrock) on the Bedrock thread pool
+    return await asyncio.get_running_loop().run_in_executor(bedrock_executor, func, *args)
+
+
+async def slack_call(method, **kwargs):
+    # Call a Slack Web API method through the rate limiter shared with the exporters, waiting out 429s
+    from slack_rate_limit import get_limiter  # Reads its settings at import, after create_app() loaded .env
+    limiter = get_limiter(method, kwargs.get('channel'))  # chat.postMessage is limited per channel
+    client_method = getattr(slack_app.client, method.replace('.', '_'))
+    while True:
+        await limiter.acquire_async()
+        try:
+            response = await client_method(**kwargs)
+            await asyncio.to_thread(limiter.on_success)
+            return response
+        except SlackApiError as e:
+            wait = retry_after(e)
+            if wait is None:
+                raise
+            logger.warning(f"{method} rate limited, retrying in {wait} seconds.")
+            await asyncio.to_thread(limiter.on_rate_limited, wait)
+
+
+async def run_task(task, *args):
+    # Run a question or escalation unless too many are already in flight
+    global in_flight
+    if in_flight >= ASYNC_MAX_IN_FLIGHT:
+        logger.warning(f"{in_flight} tasks in flight, dropping {task.__name__}")
+        return
+    in_flight += 1
+    try:
+        await task(*args)
+    except Exception as e:
+        logger.error(f"Error in {task.__name__}: {str(e)}")
+    finally:
+        in_flight -= 1
+
+
+async def skip_duplicate_events(body, next):
+    # Slack retries deliveries it thinks failed; answer each event_id once
+    event_id = body.get("event_id")
+    if body.get("type") == "event_callback" and event_id:
+        if not await asyncio.to_thread(processed_events.add, event_id):
+            logger.info(f"Duplicate event detected: {event_id}. Ignoring.")
+            return BoltResponse(status=200, body="")
+    await next()
+
+
+async def handle_message(event, say):
+    logger.info(f"Handling message: {event}")
+    try:
+        state.remember_thread_root(event)
+
+        if event.get('subtype') == 'bot_message':
+            clean_message = event['text'].strip()
+            logger.info(f"Received bot message from user {event.get('user', 'Unknown')}: {clean_message}")
+            await run_task(answer_in_thread, *thread_key(event), clean_message)
+        elif is_escalation(event):
+            await run_task(escalate_to_developers, event)
+        else:
+            logger.info("Message is neither 'bot_message' nor 'GURU HELP', ignoring.")
+    except Exception as e:
+        logger.error(f"Error processing message: {str(e)}")
+        await say(ERROR_MESSAGE)
+
+
+async def handle_mention(event, say):
+    logger.info(f"Handling app mention: {event}")
+    try:
+        state.remember_thread_root(event)
+
+        event_id = event.get("event_ts")
+        # Mark the mention as processed, add() returns False if it was already seen
+        if not event_id or not await asyncio.to_thread(processed_events.add, event_id):
+            logger.info(f"Duplicate app mention detected: {event_id}. Ignoring.")
+            return
+
+        clean_message = mention_question(event)
+        logger.info(f"Received mention from user {event['user']}: {clean_message}")
+        await run_task(answer_in_thread, *thread_key(event), clean_message)
+    except Exception as e:
+        logger.error(f"Error processing mention: {str(e)}")
+        await say(ERROR_MESSAGE)
+
+
+async def escalate_to_developers(event):
+    # Forward the original question (with its date) to the developers channel
+    original_message = await get_original_message(event)
+    await slack_call('chat.postMessage', channel=state.target_channel, text=escalation_text(event, original_message))
+
+
+async def get_original_message(event):
+    try:
+        channel_id, thread_ts = thread_key(event)
+
+        # The root was usually seen in an earlier event
+        original_message = state.cached_thread_root(channel_id, thread_ts)
+        if original_message is not None:
+            return original_message
+
+        # Otherwise fetch only the thread root
+        result = await slack_call('conversations.replies', channel=channel_id, ts=thread_ts, limit=1)
+        return state.remember_replies_root(channel_id, thread_ts, result['messages'])
+    except Exception as e:
+        logger.error(f"Error retrieving original message: {str(e)}")
+
+    return None
+
+
+async def answer_in_thread(channel, thread_ts, message):
+    # Query the knowledge base and reply in the thread (thread_ts is the thread root)
+    if state.streaming_answers:
+        await stream_answer_in_thread(channel, thread_ts, message)
+        return
+    response = await run_blocking(state.answer, message, channel, thread_ts)
+    await slack_call('chat.postMessage', channel=channel, text=response, thread_ts=thread_ts)
+
+
+async def stream_answer_in_thread(channel, thread_ts, message):
+    # Post a placeholder right away, then edit it in batches as Bedrock streams the answer
+    placeholder = await slack_call('chat.postMessage', channel=channel, text=THINKING_MESSAGE, thread_ts=thread_ts)
+    reply_ts = placeholder['ts']
+
+    from slack_rate_limit import get_limiter
+    reply = state.streamed_reply(get_limiter('chat.update'))
+    try:
+        # The Bedrock event stream is a blocking iterator, each chunk is read on the Bedrock pool
+        chunks = await run_blocking(state.answer_stream, message, channel, thread_ts)
+        while True:
+            chunk = await run_blocking(next, chunks, None)
+            if chunk is None:
+                break
+            text = await asyncio.to_thread(reply.add, chunk)
+            if text is None:
+                continue
+            try:
+                await slack_app.client.chat_update(channel=channel, ts=reply_ts, text=text)
+                await asyncio.to_thread(reply.edit_sent)
+            except Exception as e:
+                wait = retry_after(e) if isinstance(e, SlackApiError) else None
+                if wait is not None:
+                    await asyncio.to_thread(reply.edit_rate_limited, wait)
+                else:
+                    # Intermediate edits are best effort, the final edit still sends the whole answer
+                    logger.warning(f"Skipping a chat.update edit that failed: {str(e)}")
+        full_response = reply.final_text()
+    except Exception as e:
+        logger.error(f"Error in streaming message: {str(e)}")
+        full_response = ERROR_MESSAGE
+
+    # Final edit always goes through, waiting out any rate limit pause
+    await slack_call('chat.update', channel=channel, ts=reply_ts, text=full_response)
+
+
+async def api(scope, receive, send):
+    # ASGI application: Bolt plus a health check on GET /; the thread pool is shut down with the server
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                bedrock_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] == 'http' and scope['method'] == 'GET' and scope['path'] == '/':
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+        await send({'type': 'http.response.body', 'body': b'Bot is running!'})
+        return
+    await bolt_handler(scope, receive, send)
+
+
+if __name__ == "__main__":
+    import uvicorn  # pip install uvicorn
+    uvicorn.run(create_app(), host='0.0.0.0', port=int(os.environ.get("PORT", "3000")))
@@ -0,0 +1,182 @@
+import csv
+import gzip
+import io
+import json
+import threading
+import time
+
+import pytest
+
+from export_formats import open_row_writer
+from s3_stream import MIN_PART_SIZE, S3MultipartWriter
+
+# Checks S3MultipartWriter against moto's in-memory S3: pip install "moto[s3]" pytest
+boto3 = pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+
+BUCKET = 'kb-team4u-test'
+FIELDNAMES = ['timestamp', 'user', 'text', 'is_thread', 'thread_ts']
+
+
+class RecordingClient:
+    # Wraps the S3 client, records the methods called and how many upload_part calls overlap
+
+    def __init__(self, s3, upload_delay=0.0):
+        self._s3 = s3
+        self._upload_delay = upload_delay
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.max_in_flight = 0
+        self.calls = []
+
+    def upload_part(self, **kwargs):
+        with self._lock:
+            self.calls.append('upload_part')
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        try:
+            time.sleep(self._upload_delay)
+            return self._s3.upload_part(**kwargs)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def __getattr__(self, name):
+        method = getattr(self._s3, name)
+
+        def call(**kwargs):
+            with self._lock:
+                self.calls.append(name)
+            return method(**kwargs)
+
+        return call
+
+
+@pytest.fixture
+def s3():
+    mock_aws = getattr(moto, 'mock_aws', None) or moto.mock_s3  # moto 5 renamed mock_s3
+    with mock_aws():
+        client = boto3.client('s3', region_name='us-east-1', aws_access_key_id='testing',
+                              aws_secret_access_key='testing')
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def read_object(s3, key):
+    return s3.get_object(Bucket=BUCKET, Key=key)['Body'].read()
+
+
+def open_uploads(s3):
+    return s3.list_multipart_uploads(Bucket=BUCKET).get('Uploads', [])
+
+
+def sample_rows(count):
+    return [{'timestamp': f"1700000000.{i:06d}", 'user': f"U{i % 7}", 'text': f"message {i} ✓ \"quoted\", comma",
+             'is_thread': str(i % 3 == 0), 'thread_ts': f"1700000000.{i - i % 3:06d}"} for i in range(count)]
+
+
+def test_small_object_is_sent_with_one_put_object(s3):
+    client = RecordingClient(s3)
+    with S3MultipartWriter(client, BUCKET, 'small.txt') as writer:
+        writer.write(b'hello ')
+        writer.write(b'world')
+
+    assert read_object(s3, 'small.txt') == b'hello world'
+    assert client.calls == ['put_object']
+
+
+def test_large_object_is_uploaded_in_parts(s3):
+    client = RecordingClient(s3)
+    data = bytes(range(256)) * (12 * 1024 * 1024 // 256 + 3)
+    with S3MultipartWriter(client, BUCKET, 'large.bin', part_size=MIN_PART_SIZE) as writer:
+        for start in range(0, len(data), 100000):
+            writer.write(data[start:start + 100000])
+        assert writer.tell() == len(data)
+
+    assert read_object(s3, 'large.bin') == data
+    assert client.calls.count('upload_part') == 3
+    assert 'put_object' not in client.calls
+    assert open_uploads(s3) == []
+
+
+def test_parts_in_flight_are_bounded(s3):
+    client = RecordingClient(s3, upload_delay=0.05)
+    with S3MultipartWriter(client, BUCKET, 'bounded.bin', part_size=MIN_PART_SIZE, max_concurrency=2) as writer:
+        for _ in range(6):
+            writer.write(b'x' * MIN_PART_SIZE)
+
+    assert client.calls.count('upload_part') == 6
+    assert client.max_in_flight <= 2
+    assert len(read_object(s3, 'bounded.bin')) == 6 * MIN_PART_SIZE
+
+
+def test_close_without_complete_aborts_the_upload(s3):
+    writer = S3MultipartWriter(s3, BUCKET, 'aborted.bin', part_size=MIN_PART_SIZE)
+    writer.write(b'x' * (MIN_PART_SIZE + 10))
+    assert len(open_uploads(s3)) == 1
+
+    writer.close()
+
+    assert open_uploads(s3) == []
+    assert s3.list_objects_v2(Bucket=BUCKET).get('KeyCount', 0) == 0
+
+
+def test_exception_in_with_block_leaves_no_object(s3):
+    with pytest.raises(RuntimeError):
+        with S3MultipartWriter(s3, BUCKET, 'failed.bin', part_size=MIN_PART_SIZE) as writer:
+            writer.write(b'x' * (2 * MIN_PART_SIZE))
+            raise RuntimeError("export failed halfway")
+
+    assert open_uploads(s3) == []
+    assert s3.list_objects_v2(Bucket=BUCKET).get('KeyCount', 0) == 0
+
+
+def decode_csv(data):
+    return list(csv.DictReader(io.StringIO(data.decode('utf-8'), newline='')))
+
+
+def decode_jsonl(data):
+    return [json.loads(line) for line in data.decode('utf-8').splitlines()]
+
+
+def decode_jsonl_zst(data):
+    import zstandard
+    return decode_jsonl(zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)).read())
+
+
+def decode_parquet(data):
+    import pyarrow.parquet as pq
+    return pq.read_table(io.BytesIO(data)).to_pylist()
+
+
+@pytest.mark.parametrize('export_format, decode', [
+    ('csv', decode_csv),
+    ('jsonl', decode_jsonl),
+    ('jsonl.gz', lambda data: decode_jsonl(gzip.decompress(data))),
+    ('jsonl.zst', decode_jsonl_zst),
+    ('parquet', decode_parquet),
+])
+def test_export_formats_round_trip(s3, export_format, decode):
+    if export_format == 'jsonl.zst':
+        pytest.importorskip('zstandard')
+    if export_format == 'parquet':
+        pytest.importorskip('pyarrow')
+    rows = sample_rows(100000)  # About 8 MiB uncompressed: multipart for the plain formats
+
+    # Same stack and finishing order as export_channel: row writer -> BufferedWriter -> S3MultipartWriter
+    s3_writer = S3MultipartWriter(s3, BUCKET, f"export.{export_format}", part_size=MIN_PART_SIZE)
+    export_file = io.BufferedWriter(s3_writer, buffer_size=64 * 1024)
+    try:
+        row_writer = open_row_writer(export_format, export_file, FIELDNAMES)
+        for row in rows:
+            row_writer.write_row(row)
+        row_writer.close()
+        export_file.flush()
+        s3_writer.complete()
+    finally:
+        s3_writer.close()
+
+    decoded = decode(read_object(s3, f"export.{export_format}"))
+    key = lambda row: (row['thread_ts'], row['timestamp'])  # Parquet row groups are sorted
+    assert sorted(decoded, key=key) == sorted(rows, key=key)
+    assert open_uploads(s3) == []
@@ -0,0 +1,215 @@
+import importlib
+import os
+import sys
+from types import ModuleType, SimpleNamespace
+
+import pytest
+
+import model_according_to_KB
+from bot_core import BotState, StreamedReply
+from bot_messages import INTRO_MESSAGE, SUMMARY_MESSAGE, ERROR_MESSAGE
+from lru_ttl_cache import LRUTTLCache
+
+# slackbot.stream_answer_in_thread against the load test's fake Bedrock stream: chat.update edits are
+# batched per update interval, paused after a 429, and the final edit always carries the whole answer
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+from stubs import StubBedrockAgentRuntime  # noqa: E402
+
+INTERVAL = 1.0
+STEP = 0.25  # Clock advance per chunk: one update slot every 4 chunks
+QUESTION = 'x' * 184  # "Stub answer to: " + QUESTION is 200 characters, streamed as 40 chunks of 5
+ANSWER = f"Stub answer to: {QUESTION}"
+FINAL_TEXT = INTRO_MESSAGE + ANSWER + SUMMARY_MESSAGE
+
+
+class StandInSlackApiError(Exception):
+    def __init__(self, message, response):
+        super().__init__(message)
+        self.response = response
+
+
+# What slackbot imports from flask, slack_bolt and slack_sdk, for when they are not installed.
+# stream_answer_in_thread only uses SlackApiError; the apps are built by create_app(), not called here
+SLACK_STAND_INS = {
+    'flask': {'Flask': object, 'request': None, 'jsonify': dict},
+    'slack_bolt': {'App': object},
+    'slack_bolt.adapter': {},
+    'slack_bolt.adapter.flask': {'SlackRequestHandler': object},
+    'slack_sdk': {'WebClient': object},
+    'slack_sdk.errors': {'SlackApiError': StandInSlackApiError},
+}
+
+
+class FakeClock:
+    # Monotonic clock that moves STEP forward every time it is read
+
+    def __init__(self):
+        self.now = -STEP
+
+    def __call__(self):
+        self.now += STEP
+        return self.now
+
+
+class FakeLimiter:
+    # Slack budget that is always available, except for chat.update during the pause after a 429
+
+    def __init__(self, clock):
+        self._clock = clock
+        self.paused_until = float('-inf')
+        self.rate_limited = 0
+
+    def try_acquire(self):
+        return self._clock.now >= self.paused_until
+
+    def acquire(self):
+        pass
+
+    def on_success(self):
+        pass
+
+    def on_rate_limited(self, retry_after):
+        self.rate_limited += 1
+        self.paused_until = self._clock.now + retry_after
+
+
+class FakeClient:
+    # Records the Slack calls; failures maps the clock time of an intermediate edit to the
+    # (status code, error) it fails with, final_failures is how many final edits fail with a 429
+
+    def __init__(self, clock, error_class, failures=None, final_failures=0):
+        self._clock = clock
+        self._error_class = error_class
+        self.failures = failures or {}
+        self.final_failures = final_failures
+        self.posts = []
+        self.edits = []
+        self.failed_edits = []
+
+    def chat_postMessage(self, **kwargs):
+        self.posts.append(kwargs['text'])
+        return {'ts': '11.0'}
+
+    def chat_update(self, **kwargs):
+        failure = None
+        if kwargs['text'].endswith(" ..."):
+            failure = self.failures.get(self._clock.now)
+        elif self.final_failures:
+            self.final_failures -= 1
+            failure = (429, 'ratelimited')
+        if failure is not None:
+            self.failed_edits.append((self._clock.now, kwargs['text']))
+            status_code, error = failure
+            raise self._error_class(error, SimpleNamespace(status_code=status_code, headers={'Retry-After': '3'}))
+        self.edits.append((self._clock.now, kwargs['text']))
+        return {'ok': True}
+
+
+@pytest.fixture
+def slackbot(monkeypatch):
+    try:
+        for name in ('flask', 'slack_bolt.adapter.flask', 'slack_sdk.errors'):
+            importlib.import_module(name)
+    except ImportError:
+        for name, attributes in SLACK_STAND_INS.items():
+            module = ModuleType(name)
+            module.__dict__.update(attributes)
+            monkeypatch.setitem(sys.modules, name, module)
+    monkeypatch.delitem(sys.modules, 'slackbot', raising=False)
+    module = importlib.import_module('slackbot')
+    yield module
+    sys.modules.pop('slackbot', None)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def limiter(clock, monkeypatch):
+    import slack_rate_limit
+    limiter = FakeLimiter(clock)
+    monkeypatch.setattr(slack_rate_limit, 'get_limiter', lambda method, channel=None: limiter)
+    return limiter
+
+
+@pytest.fixture
+def state(slackbot, clock, monkeypatch):
+    stub = StubBedrockAgentRuntime(lambda: 0.0, chunks=40)
+    monkeypatch.setattr(model_according_to_KB, 'get_bedrock_agent_runtime', lambda: stub)
+    monkeypatch.setattr(model_according_to_KB, 'KB_CACHE_ENABLED', False)
+    monkeypatch.setattr(model_according_to_KB, 'KB_FAST_PATH', False)
+    state = BotState(LRUTTLCache(max_size=100, ttl=3600), LRUTTLCache(max_size=100, ttl=3600),
+                     streaming_answers=True, update_interval=INTERVAL)
+    monkeypatch.setattr(state, 'streamed_reply',
+                        lambda update_limiter: StreamedReply(update_limiter, INTERVAL, clock=clock))
+    monkeypatch.setattr(slackbot, 'state', state)
+    return state
+
+
+def stream_answer(slackbot, client):
+    slackbot.slack_app = SimpleNamespace(client=client)
+    slackbot.stream_answer_in_thread('C1', '10.0', QUESTION)
+    intermediate = [at for at, text in client.edits if text.endswith(" ...")]
+    return intermediate, client.edits[-1][1]
+
+
+def test_edits_are_batched_per_interval(slackbot, clock, limiter, state):
+    client = FakeClient(clock, slackbot.SlackApiError)
+
+    intermediate, final_text = stream_answer(slackbot, client)
+
+    # 40 chunks over 10 seconds: a placeholder, one edit per interval, then the final edit
+    assert len(client.posts) == 1
+    assert intermediate == [float(second) for second in range(1, 11)]
+    assert client.edits[0][1] == INTRO_MESSAGE + ANSWER[:20] + " ..."
+    assert final_text == FINAL_TEXT
+
+
+def test_rate_limit_pauses_edits(slackbot, clock, limiter, state):
+    client = FakeClient(clock, slackbot.SlackApiError, failures={2.0: (429, 'ratelimited')})
+
+    intermediate, final_text = stream_answer(slackbot, client)
+
+    # The 429 at 2s pauses edits for Retry-After (3s), then they resume once per interval
+    assert limiter.rate_limited == 1
+    assert intermediate == [1.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0]
+    assert final_text == FINAL_TEXT
+
+
+def test_final_edit_is_sent_after_rate_limit(slackbot, clock, limiter, state):
+    failures = {float(second): (429, 'ratelimited') for second in range(1, 11)}
+    client = FakeClient(clock, slackbot.SlackApiError, failures=failures, final_failures=1)
+
+    intermediate, final_text = stream_answer(slackbot, client)
+
+    # The edits at 1s, 4s, 7s and 10s each get a 429 that pauses the next ones for 3s.
+    # The final edit is not dropped by the pause: it waits out its own 429 and is sent
+    assert [at for at, _ in client.failed_edits] == [1.0, 4.0, 7.0, 10.0, 10.0]
+    assert intermediate == []
+    assert final_text == FINAL_TEXT
+
+
+def test_failed_edit_keeps_the_answer(slackbot, clock, limiter, state):
+    client = FakeClient(clock, slackbot.SlackApiError, failures={2.0: (200, 'msg_too_long')})
+
+    intermediate, final_text = stream_answer(slackbot, client)
+
+    # A failed intermediate edit is skipped without pausing the next ones
+    assert limiter.rate_limited == 0
+    assert intermediate == [1.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0]
+    assert final_text == FINAL_TEXT
+
+
+def test_bedrock_failure_ends_with_the_error_message(slackbot, clock, limiter, state, monkeypatch):
+    def failing_stream(message, channel, thread_ts):
+        yield "Partial"
+        raise RuntimeError("stream interrupted")
+
+    monkeypatch.setattr(state, 'answer_stream', failing_stream)
+    client = FakeClient(clock, slackbot.SlackApiError)
+
+    _, final_text = stream_answer(slackbot, client)
+
+    assert final_text == ERROR_MESSAGE
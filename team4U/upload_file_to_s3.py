@@ -1,37 +1,297 @@
 # pip install boto3
 import os
-import boto3
-from dotenv import load_dotenv
-from botocore.exceptions import NoCredentialsError
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-# Load the .env file
-load_dotenv()
+MB = 1024 * 1024
 
 
-def upload_to_s3(file_name, bucket, object_name=None):
+# Create one S3 client for the whole process, shared by every upload thread
+def get_s3_client(max_pool_connections=10):
+    import boto3
+    from botocore.config import Config
+    return boto3.client(
+        's3',
+        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+        config=Config(max_pool_connections=max_pool_connections, tcp_keepalive=True)
+    )
+
+
+def make_transfer_config(threshold_mb=8, chunk_size_mb=8, max_concurrency=10):
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(
+        multipart_threshold=threshold_mb * MB,
+        multipart_chunksize=chunk_size_mb * MB,
+        max_concurrency=max_concurrency,
+        use_threads=True
+    )
+
+
+class ProgressPercentage:
+    # Upload progress callback, prints the transferred size and throughput at most once per interval
+
+    def __init__(self, file_name, interval=1.0, already_uploaded=0):
+        self._file_name = file_name
+        self._size = os.path.getsize(file_name)
+        self._seen_so_far = already_uploaded
+        self._already_uploaded = already_uploaded  # Resumed parts count in the percentage, not the throughput
+        self._started = time.monotonic()
+        self._last_report = 0
+        self._interval = interval
+        self._lock = threading.Lock()
+
+    def __call__(self, bytes_amount):
+        # Called from the transfer threads
+        with self._lock:
+            self._seen_so_far += bytes_amount
+            now = time.monotonic()
+            if now - self._last_report < self._interval and self._seen_so_far < self._size:
+                return
+            self._last_report = now
+            print(f"{self._file_name}: {self._seen_so_far / MB:.1f}/{self._size / MB:.1f} MB "
+                  f"({self.percent:.1f}%) {self.throughput / MB:.2f} MB/s")
+
+    @property
+    def percent(self):
+        return 100 * self._seen_so_far / self._size if self._size else 100.0
+
+    @property
+    def throughput(self):
+        elapsed = time.monotonic() - self._started
+        return (self._seen_so_far - self._already_uploaded) / elapsed if elapsed > 0 else 0.0
+
+
+def upload_to_s3(file_name, bucket, object_name=None, transfer_config=None, s3=None):
+    from botocore.exceptions import NoCredentialsError
+
     # If S3 object_name was not specified, use file_name
     if object_name is None:
         object_name = file_name
 
     # Create an S3 client with credentials from .env
-    s3 = boto3.client(
-        's3',
-        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-    )
+    if s3 is None:
+        s3 = get_s3_client()
+
+    try:
+        progress = ProgressPercentage(file_name)
+        s3.upload_file(file_name, bucket, object_name, Config=transfer_config or make_transfer_config(),
+                       Callback=progress)
+        print(f"File {file_name} uploaded successfully to {bucket}/{object_name} "
+              f"({progress.throughput / MB:.2f} MB/s)")
+        return True
+    except FileNotFoundError:
+        print(f"The file {file_name} was not found.")
+    except NoCredentialsError:
+        print("Credentials not available.")
+    return False
+
+
+# Multipart upload that can be resumed: unlike upload_file, a failure leaves the upload open in S3,
+# and the next run only sends the parts that are missing. Add a bucket lifecycle rule to clean up
+# uploads that are never resumed.
+def resumable_upload_to_s3(file_name, bucket, object_name=None, chunk_size_mb=8, max_concurrency=10, s3=None):
+    from botocore.exceptions import NoCredentialsError
+
+    if object_name is None:
+        object_name = file_name
+    if s3 is None:
+        s3 = get_s3_client(max_pool_connections=max_concurrency)
 
     try:
-        s3.upload_file(file_name, bucket, object_name)
-        print(f"File {file_name} uploaded successfully to {bucket}/{object_name}")
+        stat = os.stat(file_name)
     except FileNotFoundError:
         print(f"The file {file_name} was not found.")
+        return False
+    file_size = stat.st_size
+
+    try:
+        upload_id, done_parts = find_incomplete_upload(s3, bucket, object_name)
+        if upload_id is None:
+            upload_id = s3.create_multipart_upload(Bucket=bucket, Key=object_name)['UploadId']
+            part_size = chunk_size_mb * MB
+        else:
+            # Keep the part size of the interrupted upload, the parts in S3 must line up with the file
+            part_size = resume_part_size(file_name, stat, upload_id, done_parts, chunk_size_mb * MB)
+            if part_size is None:
+                print(f"Abort it (aws s3api abort-multipart-upload --bucket {bucket} --key {object_name} "
+                      f"--upload-id {upload_id}) or upload without --resume.")
+                return False
+            print(f"Resuming upload of {file_name}: {len(done_parts)} parts of {part_size / MB:g} MB already in S3")
+        save_upload_state(file_name, {'bucket': bucket, 'key': object_name, 'upload_id': upload_id,
+                                      'part_size': part_size, 'size': file_size, 'mtime_ns': stat.st_mtime_ns})
+
+        part_count = max(1, -(-file_size // part_size))
+        missing = [number for number in range(1, part_count + 1) if number not in done_parts]
+        progress = ProgressPercentage(file_name, already_uploaded=sum(part['Size'] for part in done_parts.values()))
+
+        def upload_part(part_number):
+            with open(file_name, 'rb') as f:
+                f.seek((part_number - 1) * part_size)
+                body = f.read(part_size)
+            response = s3.upload_part(Bucket=bucket, Key=object_name, UploadId=upload_id,
+                                      PartNumber=part_number, Body=body)
+            progress(len(body))
+            return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            new_parts = list(executor.map(upload_part, missing))
+
+        parts = [{'PartNumber': number, 'ETag': part['ETag']} for number, part in done_parts.items()
+                 if number <= part_count] + new_parts
+        s3.complete_multipart_upload(Bucket=bucket, Key=object_name, UploadId=upload_id,
+                                     MultipartUpload={'Parts': sorted(parts, key=lambda part: part['PartNumber'])})
+        remove_upload_state(file_name)
+        print(f"File {file_name} uploaded successfully to {bucket}/{object_name} "
+              f"({progress.throughput / MB:.2f} MB/s)")
+        return True
     except NoCredentialsError:
         print("Credentials not available.")
+        return False
+
+
+# S3 does not return the metadata of an open multipart upload, so the part size and the file it was
+# started from are kept in a small state file next to the uploaded file
+def upload_state_path(file_name):
+    return file_name + '.s3upload.json'
+
+
+def save_upload_state(file_name, state):
+    with open(upload_state_path(file_name), 'w') as f:
+        json.dump(state, f)
+
+
+def load_upload_state(file_name, upload_id):
+    try:
+        with open(upload_state_path(file_name)) as f:
+            state = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return state if state.get('upload_id') == upload_id else None
+
+
+def remove_upload_state(file_name):
+    try:
+        os.remove(upload_state_path(file_name))
+    except FileNotFoundError:
+        pass
+
+
+def infer_part_size(done_parts, file_size):
+    # Part size of an upload without a state file: every part but the last one has that size.
+    # The lowest finished part is not the last one if a later part is finished, or if it is part 1
+    # and smaller than the file
+    numbers = sorted(done_parts)
+    first = done_parts[numbers[0]]
+    if len(numbers) > 1 or (numbers[0] == 1 and first['Size'] < file_size):
+        return first['Size']
+    return None
+
+
+def parts_match_file(done_parts, part_size, file_size):
+    # Whether the finished parts have the sizes a part_size split of the file gives
+    part_count = max(1, -(-file_size // part_size))
+    for number, part in done_parts.items():
+        expected = part_size if number < part_count else file_size - (part_count - 1) * part_size
+        if number > part_count or part['Size'] != expected:
+            return False
+    return True
+
+
+def resume_part_size(file_name, stat, upload_id, done_parts, default_part_size):
+    # Part size to resume upload_id with, or None (after printing why) when resuming would corrupt the object
+    if not done_parts:
+        return default_part_size
+    state = load_upload_state(file_name, upload_id)
+    if state is not None:
+        if (state['size'], state['mtime_ns']) != (stat.st_size, stat.st_mtime_ns):
+            print(f"{file_name} changed since upload {upload_id} started, not resuming it.")
+            return None
+        part_size = state['part_size']
+    else:
+        print(f"No state file for upload {upload_id}, changes to {file_name} cannot be detected.")
+        part_size = infer_part_size(done_parts, stat.st_size)
+        if part_size is None:
+            print(f"Cannot tell the part size of upload {upload_id} from its parts, not resuming it.")
+            return None
+
+    if not parts_match_file(done_parts, part_size, stat.st_size):
+        print(f"The parts of upload {upload_id} do not match {file_name} split in {part_size / MB:g} MB parts, "
+              f"not resuming it.")
+        return None
+    return part_size
+
+
+def find_incomplete_upload(s3, bucket, object_name):
+    # Return (upload_id, {part_number: part}) of the latest open multipart upload of the key
+    uploads = s3.list_multipart_uploads(Bucket=bucket, Prefix=object_name).get('Uploads', [])
+    uploads = [upload for upload in uploads if upload['Key'] == object_name]
+    if not uploads:
+        return None, {}
+    upload_id = max(uploads, key=lambda upload: upload['Initiated'])['UploadId']
+
+    done_parts = {}
+    paginator = s3.get_paginator('list_parts')
+    for page in paginator.paginate(Bucket=bucket, Key=object_name, UploadId=upload_id):
+        for part in page.get('Parts', []):
+            done_parts[part['PartNumber']] = part
+    return upload_id, done_parts
+
+
+# Upload every file of a directory concurrently over one pooled client
+def upload_directory_to_s3(directory, bucket, prefix='', transfer_config=None, max_files=4):
+    transfer_config = transfer_config or make_transfer_config()
+    s3 = get_s3_client(max_pool_connections=max_files * transfer_config.max_request_concurrency)
+
+    files = []
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            key = prefix + os.path.relpath(path, directory).replace(os.sep, '/')
+            files.append((path, key))
+
+    started = time.monotonic()
+    total_bytes = sum(os.path.getsize(path) for path, _ in files)
+    with ThreadPoolExecutor(max_workers=max_files) as executor:
+        results = list(executor.map(lambda item: upload_to_s3(item[0], bucket, item[1], transfer_config, s3),
+                                    files))
+    elapsed = time.monotonic() - started
+
+    print(f"Uploaded {sum(results)}/{len(files)} files ({total_bytes / MB:.1f} MB) in {elapsed:.1f}s "
+          f"({total_bytes / MB / elapsed if elapsed else 0:.2f} MB/s)")
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload a file or a directory to S3")
+    parser.add_argument('path', nargs='?', default='slack_messages.csv', help="File or directory to upload")
+    parser.add_argument('--bucket', default='kb-team4u')
+    parser.add_argument('--key', help="Object name for a single file (default: the file name)")
+    parser.add_argument('--prefix', default='', help="Key prefix for directory uploads")
+    parser.add_argument('--threshold-mb', type=int, default=8, help="Size from which multipart upload is used")
+    parser.add_argument('--chunk-size-mb', type=int, default=8, help="Multipart part size")
+    parser.add_argument('--max-concurrency', type=int, default=10, help="Parts uploaded in parallel per file")
+    parser.add_argument('--max-files', type=int, default=4, help="Files uploaded in parallel in directory mode")
+    parser.add_argument('--resume', action='store_true', help="Resume an interrupted multipart upload of the file")
+    args = parser.parse_args()
+
+    # Load the .env file
+    from dotenv import load_dotenv
+    load_dotenv()
 
+    transfer_config = make_transfer_config(args.threshold_mb, args.chunk_size_mb, args.max_concurrency)
+    if os.path.isdir(args.path):
+        ok = upload_directory_to_s3(args.path, args.bucket, args.prefix, transfer_config, args.max_files)
+    elif args.resume:
+        ok = resumable_upload_to_s3(args.path, args.bucket, args.key, args.chunk_size_mb, args.max_concurrency)
+    else:
+        ok = upload_to_s3(args.path, args.bucket, args.key, transfer_config)
+    sys.exit(0 if ok else 1)
 
-# Example usage
-file_name = 'C:/Users/user/Desktop/projects/Team4U/team4U/slack_messages.csv'
-bucket_name = 'kb-team4u'
-object_name = 'testAsaf'
 
-upload_to_s3(file_name, bucket_name, object_name)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedWorkerPool:
+    """Thread pool with a fixed number of workers and a bounded backlog.
+
+    submit() never blocks: once every worker is busy and the backlog is full
+    the task is rejected, so latency sensitive callers (like the Slack ack)
+    can shed load instead of queueing without limit.
+    """
+
+    def __init__(self, max_workers, queue_depth, name="worker"):
+        self.max_workers = max_workers
+        self.queue_depth = queue_depth
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        # One slot per running task plus one per queued task
+        self._slots = threading.BoundedSemaphore(max_workers + queue_depth)
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.rejected = 0
+
+    def submit(self, fn, *args, **kwargs):
+        # Return True if the task was accepted, False if the pool is full
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            return False
+
+        try:
+            self._executor.submit(self._run, fn, args, kwargs)
+        except RuntimeError:
+            # The executor has been shut down
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def _run(self, fn, args, kwargs):
+        try:
+            fn(*args, **kwargs)
+        except Exception:
+            logger.exception(f"Unhandled error in background task {getattr(fn, '__name__', fn)}")
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self.queue_depth,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)